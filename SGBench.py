@@ -0,0 +1,290 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from typing import List
+
+import numpy as np
+import qiskit
+from qiskit import Aer, transpile
+
+import SGFrustration as sgf
+
+# Stages slower than this fraction of the baseline are reported as regressions
+REGRESSION_THRESHOLD = 0.1
+
+# Stages faster than this (seconds), or growing memory by less than this (MiB), in
+# both reports are too small to compare: timer noise alone is more than the threshold
+MIN_STAGE_SECONDS = 1e-3
+MIN_STAGE_MB = 1.0
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description="Per-stage timing and memory of the SGFrustration pipeline"
+    )
+    parser.add_argument(
+        "-N", type=int, nargs="+", default=[3, 4, 5, 6], help="Numbers of spins"
+    )
+    parser.add_argument(
+        "-loops",
+        type=int,
+        nargs="+",
+        help="Grover iteration counts (default: the counted optimum for each N)",
+    )
+    parser.add_argument(
+        "-engine", choices=sgf.ENGINES, nargs="+", default=list(sgf.ENGINES)
+    )
+    parser.add_argument(
+        "-oracle", choices=sgf.ORACLES, nargs="+", default=list(sgf.ORACLES)
+    )
+    parser.add_argument(
+        "-symmetric", action="store_true", help="Fix spin 0 (spin flip symmetry)"
+    )
+    parser.add_argument("-output", type=str, help="Write the report to this file")
+    parser.add_argument(
+        "-compare",
+        type=str,
+        nargs=2,
+        metavar=("BASELINE", "REPORT"),
+        help="Compare two reports instead of running",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            report = json.load(f)
+        regressions = print_comparison(compare(baseline, report))
+        sys.exit(1 if regressions else 0)
+
+    report = run(args.N, args.loops, args.engine, args.oracle, args.symmetric)
+    if args.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+def run(
+    N_values: List[int],
+    loop_numbers: List[int] = None,
+    engines: List[str] = sgf.ENGINES,
+    oracles: List[str] = sgf.ORACLES,
+    symmetric: bool = False,
+) -> dict:
+    cases = []
+    for N in N_values:
+        for loop_number in loop_numbers or [None]:
+            for engine in engines:
+                # The NumPy engine doesn't build an oracle circuit
+                for oracle in oracles if engine == "aer" else ["ancilla"]:
+                    cases.append((N, loop_number, engine, oracle, symmetric))
+
+    # Each case gets a fresh process so its peak RSS isn't left over from the last
+    results = []
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        for case in cases:
+            result = pool.apply(bench_case, case)
+            print(
+                f"N={result['N']} loops={result['loop_number']} {result['engine']} "
+                f"{result['oracle']}: {result['total_seconds']:.3f}s",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "qiskit": qiskit.__version__,
+            "platform": platform.platform(),
+        },
+        "cases": results,
+    }
+
+
+def bench_case(
+    N: int,
+    loop_number: int = None,
+    engine: str = "aer",
+    oracle: str = "ancilla",
+    symmetric: bool = False,
+) -> dict:
+    bond_list = sgf.bond_list_maker(N)
+    num_of_bonds = len(bond_list)
+    if loop_number is None:
+        loop_number = sgf.grover_loop_number(
+            num_of_bonds, sgf.count_solutions(N, bond_list)
+        )
+    result = {
+        "N": N,
+        "loop_number": loop_number,
+        "engine": engine,
+        "oracle": oracle,
+        "symmetric": symmetric,
+        "stages": {},
+    }
+    stage = StageTimer(result["stages"])
+
+    if engine == "aer":
+        backend = Aer.get_backend("aer_simulator_statevector")
+        with stage("construction"):
+            qc = sgf.grover_circuit(N, bond_list, loop_number, oracle, symmetric)
+        result["circuit"] = circuit_stats(qc)
+        with stage("transpile"):
+            tqc = transpile(qc, backend)
+        result["transpiled"] = circuit_stats(tqc)
+        with stage("simulation"):
+            tqc.save_statevector()
+            final_state_vector = backend.run(tqc).result().get_statevector(tqc)
+        with stage("probabilities"):
+            num_of_spin_qubits = qc.qregs[0].size
+            probabilities = final_state_vector.probabilities(
+                [i for i in range(num_of_spin_qubits + num_of_bonds)]
+            ).reshape(2**num_of_bonds, 2**num_of_spin_qubits)
+    elif engine == "numpy":
+        with stage("construction"):
+            phase_mask = sgf.oracle_phase_mask(N, bond_list, symmetric)
+        with stage("simulation"):
+            probabilities = sgf.simulate_numpy(
+                N, bond_list, loop_number, symmetric, phase_mask
+            )
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    with stage("consolidation"):
+        output_obj = sgf.consolidate(probabilities, N, num_of_bonds, symmetric)
+
+    result["bond_states_found"] = len(output_obj)
+    result["total_seconds"] = sum(s["seconds"] for s in result["stages"].values())
+    return result
+
+
+class StageTimer:
+    """Context manager factory recording wall time and peak RSS growth of each stage"""
+
+    def __init__(self, stages: dict):
+        self.stages = stages
+        self.name = None
+
+    def __call__(self, name: str):
+        self.name = name
+        return self
+
+    def __enter__(self):
+        self.rss = reset_peak_rss()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.stages[self.name] = {
+            "seconds": seconds,
+            "rss_growth_mb": max(0.0, peak_rss_mb() - self.rss),
+        }
+
+
+def reset_peak_rss() -> float:
+    # Resets the peak RSS of this process where Linux allows it and returns the RSS
+    # (MiB) to measure growth from. Elsewhere the peak can't be reset, so this is the
+    # peak so far, and only stages that raise it show any growth
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return proc_status_mb("VmRSS")
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    try:
+        return proc_status_mb("VmHWM")
+    except OSError:
+        # ru_maxrss is in KiB on Linux but bytes on macOS
+        scale = 1024**2 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def proc_status_mb(field: str) -> float:
+    # A memory field of /proc/self/status, which are given in KiB
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise OSError(f"{field} not in /proc/self/status")
+
+
+def circuit_stats(qc) -> dict:
+    return {
+        "qubits": qc.num_qubits,
+        "depth": qc.depth(),
+        "gates": {name: count for name, count in qc.count_ops().items()},
+    }
+
+
+def case_key(case: dict) -> tuple:
+    return (
+        case["N"],
+        case["loop_number"],
+        case["engine"],
+        case["oracle"],
+        case["symmetric"],
+    )
+
+
+def compare(
+    baseline: dict, report: dict, threshold: float = REGRESSION_THRESHOLD
+) -> List[dict]:
+    # Stage by stage ratios (report / baseline) for the cases both reports ran
+    baseline_cases = {case_key(case): case for case in baseline["cases"]}
+    rows = []
+    for case in report["cases"]:
+        old = baseline_cases.get(case_key(case))
+        if old is None:
+            continue
+        for name, stage in case["stages"].items():
+            if name not in old["stages"]:
+                continue
+            old_stage = old["stages"][name]
+            seconds = (old_stage["seconds"], stage["seconds"])
+            growth = (old_stage["rss_growth_mb"], stage["rss_growth_mb"])
+            time_ratio = seconds[1] / max(seconds[0], 1e-9)
+            rss_ratio = growth[1] / max(growth[0], 1e-9)
+            rows.append(
+                {
+                    "case": case_key(case),
+                    "stage": name,
+                    "seconds": seconds,
+                    "time_ratio": time_ratio,
+                    "rss_ratio": rss_ratio,
+                    "regression": (
+                        max(seconds) >= MIN_STAGE_SECONDS and time_ratio > 1 + threshold
+                    )
+                    or (max(growth) >= MIN_STAGE_MB and rss_ratio > 1 + threshold),
+                }
+            )
+    return rows
+
+
+def print_comparison(rows: List[dict]) -> int:
+    print(
+        f"{'N':>3}{'loops':>7}{'engine':>8}{'oracle':>9}{'stage':>15}"
+        f"{'before':>10}{'after':>10}{'time':>8}{'rss':>8}"
+    )
+    for row in rows:
+        N, loops, engine, oracle, _ = row["case"]
+        print(
+            f"{N:>3}{loops:>7}{engine:>8}{oracle:>9}{row['stage']:>15}"
+            f"{row['seconds'][0]:>10.4f}{row['seconds'][1]:>10.4f}"
+            f"{row['time_ratio']:>8.2f}{row['rss_ratio']:>8.2f}"
+            + ("  REGRESSION" if row["regression"] else "")
+        )
+    return sum(row["regression"] for row in rows)
+
+
+if __name__ == "__main__":
+    main()
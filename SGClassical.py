@@ -0,0 +1,95 @@
+import argparse
+import json
+from typing import List
+
+import numpy as np
+
+from SGFrustration import bond_list_maker, solution_bond_bits
+
+
+# Spin states are enumerated this many at a time to bound memory for large N
+CHUNK_SIZE = 2**16
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Exact classical enumeration of the non-frustrated bond configurations "
+            "of a fully connected Ising spin glass"
+        )
+    )
+    parser.add_argument("-N", type=int, required=True, help="Number of spins")
+    parser.add_argument("-output", type=str, help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    output_obj = unfrustrated_bond_configs(args.N)
+    if args.output is None:
+        print(json.dumps(output_obj, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(output_obj, f, indent=4)
+
+
+def unfrustrated_bond_configs(N: int) -> dict:
+    # Every non-frustrated bond configuration with the spin states that solve it, in
+    # the same form (and order) as the output_obj of SGFrustration. A configuration is
+    # non-frustrated exactly when J_ij = s_i * s_j for some spin state s, so there is
+    # one for each pair of spin states related by a global flip: 2^(N-1) in all,
+    # each of which an ideal Grover search finds with probability 1 / 2^(N-1)
+    output_obj = {}
+    for bond_states, spin_states, flipped in iter_unfrustrated_bond_configs(N):
+        for bond_state, spin_state, flipped_state in zip(
+            bond_states, spin_states, flipped
+        ):
+            output_obj[bond_state] = {
+                "probability": 1 / 2 ** (N - 1),
+                "spin_states": sorted([spin_state, flipped_state]),
+            }
+    return dict(sorted(output_obj.items()))
+
+
+def iter_unfrustrated_bond_configs(N: int, chunk_size: int = CHUNK_SIZE):
+    # Yields (bond states, spin states, flipped spin states) as lists of bitstrings,
+    # chunk_size spin states (with spin 0 fixed to 0) at a time. Bitstrings read like
+    # qiskit's: bond 0 and spin 0 are the rightmost characters
+    bond_list = bond_list_maker(N)
+    for start in range(0, 2 ** (N - 1), chunk_size):
+        stop = min(start + chunk_size, 2 ** (N - 1))
+        # Spin 0 stays 0, the others count up
+        spin_states = np.arange(start, stop, dtype=np.int64) << 1
+        spin_bits = ((spin_states[:, None] >> np.arange(N)) & 1).astype(np.uint8)
+        bond_bits = solution_bond_bits(spin_bits, bond_list).astype(np.uint8)
+        yield (
+            bits_to_strings(bond_bits),
+            bits_to_strings(spin_bits),
+            bits_to_strings(1 - spin_bits),
+        )
+
+
+def bits_to_strings(bits: np.ndarray) -> List[str]:
+    # Rows of 0/1 to bitstrings with column 0 as the rightmost character, without
+    # going through Python ints (bond states don't fit in 64 bits past N = 11)
+    width = bits.shape[1]
+    text = (bits[:, ::-1] + ord("0")).astype(np.uint8).tobytes().decode("ascii")
+    return [text[i : i + width] for i in range(0, len(text), width)]
+
+
+def verify(output_obj: dict, N: int) -> dict:
+    # Compare a Grover search result against the exact enumeration. Returns the bond
+    # configurations it missed, the ones it shouldn't have found and the ones whose
+    # spin states are wrong, all empty when the result is correct
+    exact = unfrustrated_bond_configs(N)
+    return {
+        "missing": [b for b in exact if b not in output_obj],
+        "unexpected": [b for b in output_obj if b not in exact],
+        "wrong_spin_states": [
+            b
+            for b in output_obj
+            if b in exact
+            and sorted(output_obj[b]["spin_states"]) != exact[b]["spin_states"]
+        ],
+    }
+
+
+if __name__ == "__main__":
+    main()
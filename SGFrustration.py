@@ -1,17 +1,31 @@
 # initialization
+import argparse
+import glob
 import itertools as it
+import json
 import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 
 
+import numpy as np
+
 # importing Qiskit
+import qiskit
 from qiskit import (
     Aer,
     QuantumCircuit,
     ClassicalRegister,
     QuantumRegister,
+    qpy,
     transpile,
 )
+from qiskit.circuit.library import QFT
+from qiskit.transpiler.passes import RemoveBarriers
+import qiskit_aer
+from qiskit_aer.library import SaveProbabilities
 
 
 # import basic plot tools
@@ -20,57 +34,254 @@ from qiskit.visualization import plot_histogram
 import pprint
 
 
-LOOP_DICT = {3: 6, 4: 6, 5: 24}
+# The number of Grover loops is the fewest that reach this probability of measuring a solution
+MIN_SUCCESS_PROBABILITY = 0.99
+
+# Bond + spin states less likely than this are dropped from the results
+PROBABILITY_THRESHOLD = 0.0001
+
+# Available simulation engines: the Aer statevector simulator or plain NumPy
+ENGINES = ("aer", "numpy")
+
+# Oracle constructions: XOR ladders + mcx into a |-> ancilla every iteration, or an
+# ancilla-free multi-controlled Z with a single XOR ladder at the end (see grover_circuit)
+ORACLES = ("ancilla", "phase")
+
+# Most counting qubits quantum counting will simulate: the jth one controls 2^j Grover
+# iterations, so each extra qubit doubles the circuit
+MAX_COUNTING_QUBITS = 6
+
+# Transpiled circuits are cached here as QPY files, least recently used ones are
+# deleted once they take up more than CIRCUIT_CACHE_MAX_BYTES
+CIRCUIT_CACHE_DIR = os.path.join(
+    os.environ.get("QISKITSG_CACHE", os.path.join(os.path.expanduser("~"), ".cache")),
+    "QiskitSG",
+    "circuits",
+)
+CIRCUIT_CACHE_MAX_BYTES = 2**30
+
+# Ends the name of every cached circuit: circuits transpiled by other versions of
+# qiskit or Aer (whose backends set the target) aren't reused
+CIRCUIT_CACHE_VERSIONS = f"_qiskit{qiskit.__version__}_aer{qiskit_aer.__version__}.qpy"
 
 
-def main():
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Grover search for the non-frustrated bond configurations of a fully "
+            "connected Ising spin glass. Interactive without -N"
+        )
+    )
+    parser.add_argument(
+        "-N", type=int, nargs="+", help="Numbers of spins to run, in batch mode"
+    )
+    parser.add_argument("-engine", choices=ENGINES, default="aer")
+    parser.add_argument("-oracle", choices=ORACLES, default="ancilla")
+    parser.add_argument(
+        "-symmetric", action="store_true", help="Fix spin 0 (spin flip symmetry)"
+    )
+    parser.add_argument(
+        "-loops", type=int, help="Grover iterations (default: counted for each N)"
+    )
+    parser.add_argument(
+        "-workers", type=int, default=1, help="Processes to run the N values in"
+    )
+    parser.add_argument(
+        "-output", type=str, help="Write the results to this .json or .npz file"
+    )
+    parser.add_argument(
+        "-verify",
+        action="store_true",
+        help="Check the results against exact classical enumeration",
+    )
+    parser.add_argument(
+        "-sweep",
+        type=int,
+        nargs="?",
+        const=0,
+        metavar="MAX_LOOPS",
+        help="Instead of searching, give the success probability and most probable "
+        "bond states after every iteration up to MAX_LOOPS (default: twice the "
+        "counted optimum)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.N is None:
+        if args.sweep is not None:
+            parser.error("-sweep needs -N")
+        interactive()
+        return
+
+    if args.sweep is not None:
+        if args.output is not None and not args.output.endswith(".json"):
+            parser.error("-sweep results can only be written to a .json file")
+        sweeps = [
+            {
+                "N": N,
+                "engine": args.engine,
+                "oracle": args.oracle,
+                "symmetric": args.symmetric,
+                "sweep": grover_sweep(
+                    N, args.sweep or None, args.engine, args.oracle, args.symmetric
+                ),
+            }
+            for N in args.N
+        ]
+        if args.output is None:
+            for result in sweeps:
+                print(f"N={result['N']}")
+                print_sweep(result["sweep"])
+        else:
+            with open(args.output, "w") as f:
+                json.dump(sweeps, f, indent=4)
+        return
+
+    results = batch(
+        args.N,
+        engine=args.engine,
+        oracle=args.oracle,
+        symmetric=args.symmetric,
+        loop_number=args.loops,
+        workers=args.workers,
+        verify=args.verify,
+    )
+    if args.output is None:
+        print(json.dumps(results, indent=4))
+    elif args.output.endswith(".npz"):
+        save_npz(results, args.output)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+def batch(
+    N_values: List[int],
+    engine: str = "aer",
+    oracle: str = "ancilla",
+    symmetric: bool = False,
+    loop_number: int = None,
+    workers: int = 1,
+    verify: bool = False,
+) -> List[dict]:
+    # Run grover_search for every N, in a pool of worker processes when workers > 1
+    options = dict(
+        engine=engine,
+        oracle=oracle,
+        symmetric=symmetric,
+        loop_number=loop_number,
+        verify=verify,
+    )
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(batch_run, N, **options) for N in N_values]
+            return [f.result() for f in futures]
+    return [batch_run(N, **options) for N in N_values]
+
+
+def batch_run(
+    N: int,
+    engine: str = "aer",
+    oracle: str = "ancilla",
+    symmetric: bool = False,
+    loop_number: int = None,
+    verify: bool = False,
+) -> dict:
+    start = time.perf_counter()
+    bond_list = bond_list_maker(N)
+    if loop_number is None:
+        loop_number = grover_loop_number(len(bond_list), count_solutions(N, bond_list))
+    output_obj = grover_search(N, engine, loop_number, oracle, symmetric)
+    seconds = time.perf_counter() - start
+
+    result = {
+        "N": N,
+        "engine": engine,
+        "oracle": oracle,
+        "symmetric": symmetric,
+        "loop_number": loop_number,
+        "seconds": seconds,
+        "output": {
+            bond_state: {
+                "probability": float(entry["probability"]),
+                "spin_states": entry["spin_states"],
+            }
+            for bond_state, entry in output_obj.items()
+        },
+    }
+    if verify:
+        # Imported here, SGClassical imports this module
+        import SGClassical
+
+        result["verification"] = SGClassical.verify(output_obj, N)
+    return result
+
+
+def save_npz(results: List[dict], filename: str):
+    # One set of arrays per N. spin_states[i] solves bond_states[spin_bond_index[i]]
+    arrays = {}
+    for result in results:
+        output = result["output"]
+        prefix = f"N{result['N']}_"
+        arrays[prefix + "loop_number"] = np.array(result["loop_number"])
+        arrays[prefix + "bond_states"] = np.array(list(output), dtype=str)
+        arrays[prefix + "probabilities"] = np.array(
+            [entry["probability"] for entry in output.values()]
+        )
+        arrays[prefix + "spin_states"] = np.array(
+            [s for entry in output.values() for s in entry["spin_states"]], dtype=str
+        )
+        arrays[prefix + "spin_bond_index"] = np.array(
+            [i for i, entry in enumerate(output.values()) for _ in entry["spin_states"]]
+        )
+    np.savez(filename, **arrays)
+
+
+def interactive():
     # Get number of spins
     while True:
         N = int(input("Number of spins/qubits: "))
-        if N in LOOP_DICT:
+        if N >= 3:
             break
-        print(
-            f"Unable to calculate for this size. Possible sizes: {list(LOOP_DICT.keys())}"
-        )
+        print("Unable to calculate for this size. Need at least 3 spins.")
 
     bond_list = bond_list_maker(N)
     num_of_bonds = len(bond_list)
 
-    # Build requisite quantum and classical registers
-    spin_qubits = QuantumRegister(N, name="spin")
-    bond_qubits = QuantumRegister(num_of_bonds, name="bond")
-    multi_control_qubit = QuantumRegister(1, name="multi")
-    cbits = ClassicalRegister(num_of_bonds, name="cbit")
-    qc = QuantumCircuit(spin_qubits, bond_qubits, multi_control_qubit, cbits)
-
-    # Initialize multi control qubit to |-> state
-    qc.x(multi_control_qubit)
-    qc.h(multi_control_qubit)
-    qc.barrier()  # for visual separation
-
-    # Initialise spin and bond qubits in state |++...+> (equal superposition)
-    qc.h(spin_qubits)
-    qc.h(bond_qubits)
-    qc.barrier()
-
-    # We don't know how many solutions there are so we can't calculate the optimal number of loops
-    # TODO: Implement quantum counting to find number of solutions
-    # Until we implement the above, we just use the LOOP_DICT dictionary I made from trial and error
+    # Count the solutions so we can calculate the optimal number of loops
+    num_of_solutions = count_solutions(N, bond_list)
+    loop_number = grover_loop_number(num_of_bonds, num_of_solutions)
+    print(
+        f"{num_of_solutions} solution(s) per spin state, running {loop_number} Grover iterations"
+    )
 
-    loop_number = LOOP_DICT[N]
+    while True:
+        oracle = input(f"Oracle? ({'/'.join(ORACLES)})").lower()
+        if oracle in ORACLES:
+            break
+        print("invalid input")
 
-    for _ in range(loop_number):
-        # Add the oracle - this adds a negative phase only to solutions
-        SG_oracle(qc, bond_list, bond_qubits, multi_control_qubit)
-        qc.barrier()
-        # Add the diffuser, this "reflects" the state vector around the equal superposition vector
-        # We make this a gate for legibility
-        qc.append(diffuser(num_of_bonds), bond_qubits)
+    while True:
+        cmpqc = input("Compare oracle depth and CX counts? (y/n)")
+        if cmpqc == "y" or cmpqc == "yes":
+            print_oracle_report(oracle_report(N, bond_list, loop_number))
+            break
+        elif cmpqc.lower() in ("n", "no"):
+            break
+        else:
+            print("invalid input")
 
-    # print(qc.draw())
+    while True:
+        symqc = input("Fix spin 0 to halve the search (spin flip symmetry)? (y/n)")
+        if symqc == "y" or symqc == "yes":
+            symmetric = True
+            break
+        elif symqc.lower() in ("n", "no"):
+            symmetric = False
+            break
+        else:
+            print("invalid input")
 
-    # Measure the variable qubits
-    # qc.measure(bond_qubits, cbits)
+    qc = grover_circuit(N, bond_list, loop_number, oracle, symmetric)
 
     # Print/Save circuit interface
     while True:
@@ -94,49 +305,44 @@ def main():
         else:
             print("invalid input")
 
-    print("Simulating quantum circuit...")
+    while True:
+        engine = input(f"Simulation engine? ({'/'.join(ENGINES)})").lower()
+        if engine in ENGINES:
+            break
+        print("invalid input")
 
-    # Send circuit to backend to get exact mathematical state of circuit before measuring
-    backend = Aer.get_backend("aer_simulator_statevector")
-    qc.save_statevector()
-    result = backend.run(transpile(qc, backend)).result()
-    final_state_vector = result.get_statevector(qc)
+    print("Simulating quantum circuit...")
 
-    # Get probabilities of each bond + spin state combo
-    probabilities_dict = final_state_vector.probabilities_dict(
-        [i for i in range(N + num_of_bonds)]
-    )
+    if engine == "aer":
+        backend = Aer.get_backend("aer_simulator_statevector")
+        tqc = transpiled_grover_circuit(
+            N, bond_list, loop_number, backend, oracle=oracle, symmetric=symmetric
+        )
+        probabilities = simulate_aer(tqc, num_of_bonds, transpiled=True)
+    else:
+        probabilities = simulate_numpy(N, bond_list, loop_number, symmetric)
 
-    # Consolidate most probable bonds and their solution spin states
-    output_obj = {}
-    for key in probabilities_dict:
-        if probabilities_dict[key] > 0.0001:
-            bond_state = key[:num_of_bonds]
-            spin_sate = key[0 - N :]
-            if bond_state not in output_obj:
-                output_obj[bond_state] = {
-                    "probability": probabilities_dict[key],
-                    "spin_states": [spin_sate],
-                }
-            else:
-                output_obj[bond_state]["probability"] += probabilities_dict[key]
-                output_obj[bond_state]["spin_states"].append(spin_sate)
+    output_obj = consolidate(probabilities, N, num_of_bonds, symmetric)
 
     print(
         "Here are the bond states with no frustration and the spin states that solve them"
     )
     pprint.PrettyPrinter(indent=4).pprint(output_obj)
 
-    # Give the option to visualize bond configurations using SGViz.py
+    # Give the option to visualize bond configurations using SGViz.py, in one viewer
+    # that steps through all of them
     while True:
         bond_config = input(
-            f"Input bond configuration from keys of object above (Example: {list(output_obj.keys())[0]}) to visualize (q to to quit): "
+            f"Input bond configuration from keys of object above (Example: {list(output_obj.keys())[0]}) to visualize, Up/Down in the viewer steps through the others (q to to quit): "
         )
         if bond_config.lower() in ("q", "quit"):
             print("Goodbye!")
             break
         if bond_config in output_obj:
-            os.system("python3 SGViz.py -loadBC -BC " + bond_config + " -N " + str(N))
+            # Imported here, PyQt is only needed to visualize
+            import SGViz
+
+            SGViz.browse(output_obj, N, bond_config)
         else:
             print("not a valid input")
 
@@ -171,9 +377,602 @@ def diffuser(nqubits: int):
     return U_s
 
 
+def grover_search(
+    N: int,
+    engine: str = "aer",
+    loop_number: int = None,
+    oracle: str = "ancilla",
+    symmetric: bool = False,
+) -> dict:
+    # Non-interactive version of main: run the search and return the consolidated
+    # bond states and their solution spin states
+    bond_list = bond_list_maker(N)
+    num_of_bonds = len(bond_list)
+    if loop_number is None:
+        loop_number = grover_loop_number(num_of_bonds, count_solutions(N, bond_list))
+
+    if engine == "aer":
+        backend = Aer.get_backend("aer_simulator_statevector")
+        qc = transpiled_grover_circuit(
+            N, bond_list, loop_number, backend, oracle=oracle, symmetric=symmetric
+        )
+        probabilities = simulate_aer(qc, num_of_bonds, transpiled=True)
+    elif engine == "numpy":
+        probabilities = simulate_numpy(N, bond_list, loop_number, symmetric)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    return consolidate(probabilities, N, num_of_bonds, symmetric)
+
+
+def grover_circuit(
+    N: int,
+    bond_list: List[List[int]],
+    loop_number: int,
+    oracle: str = "ancilla",
+    symmetric: bool = False,
+    snapshots: bool = False,
+):
+    # With symmetric=True spin 0 is fixed to 0 and left out of the circuit. Every
+    # solution has a global spin flip partner, so none are lost, and consolidate
+    # adds the flipped spin states back
+    # With snapshots=True the spin + bond probabilities are saved before the first
+    # and after every Grover iteration (see grover_sweep)
+    if oracle == "phase":
+        return grover_phase_circuit(N, bond_list, loop_number, symmetric, snapshots)
+    if oracle != "ancilla":
+        raise ValueError(f"Unknown oracle: {oracle}")
+
+    num_of_bonds = len(bond_list)
+
+    # Build requisite quantum and classical registers
+    spin_qubits = QuantumRegister(N - 1 if symmetric else N, name="spin")
+    bond_qubits = QuantumRegister(num_of_bonds, name="bond")
+    multi_control_qubit = QuantumRegister(1, name="multi")
+    cbits = ClassicalRegister(num_of_bonds, name="cbit")
+    qc = QuantumCircuit(spin_qubits, bond_qubits, multi_control_qubit, cbits)
+
+    # Initialize multi control qubit to |-> state
+    qc.x(multi_control_qubit)
+    qc.h(multi_control_qubit)
+    qc.barrier()  # for visual separation
+
+    # Initialise spin and bond qubits in state |++...+> (equal superposition)
+    qc.h(spin_qubits)
+    qc.h(bond_qubits)
+    qc.barrier()
+    if snapshots:
+        save_snapshot(qc, spin_qubits, bond_qubits, 0)
+
+    for k in range(loop_number):
+        # Add the oracle - this adds a negative phase only to solutions
+        SG_oracle(
+            qc,
+            bond_list,
+            bond_qubits,
+            multi_control_qubit,
+            spin_controls(spin_qubits, symmetric),
+        )
+        qc.barrier()
+        # Add the diffuser, this "reflects" the state vector around the equal superposition vector
+        # We make this a gate for legibility
+        qc.append(diffuser(num_of_bonds), bond_qubits)
+        if snapshots:
+            save_snapshot(qc, spin_qubits, bond_qubits, k + 1)
+
+    return qc
+
+
+def grover_phase_circuit(
+    N: int,
+    bond_list: List[List[int]],
+    loop_number: int,
+    symmetric: bool = False,
+    snapshots: bool = False,
+):
+    # SG_oracle is U Z U, where U is the XOR ladder and Z flips the phase of bond
+    # state |11..1>. For every spin state U just permutes the bond states, so it
+    # leaves |++..+> alone and commutes with the diffuser. (D U Z U)^k |+> is then
+    # U (D Z)^k |+>: the loops only need the phase flip and the ladder runs once
+    num_of_bonds = len(bond_list)
+
+    spin_qubits = QuantumRegister(N - 1 if symmetric else N, name="spin")
+    bond_qubits = QuantumRegister(num_of_bonds, name="bond")
+    cbits = ClassicalRegister(num_of_bonds, name="cbit")
+    qc = QuantumCircuit(spin_qubits, bond_qubits, cbits)
+
+    # Initialise spin and bond qubits in state |++...+> (equal superposition)
+    qc.h(spin_qubits)
+    qc.h(bond_qubits)
+    qc.barrier()
+    if snapshots:
+        save_snapshot(qc, spin_qubits, bond_qubits, 0)
+
+    spins = spin_controls(spin_qubits, symmetric)
+    for k in range(loop_number):
+        SG_phase_oracle(qc, bond_qubits)
+        qc.append(diffuser(num_of_bonds), bond_qubits)
+        if snapshots and k < loop_number - 1:
+            # Snapshots are taken with the ladder applied, then it's undone to keep looping
+            bond_ladder(qc, bond_list, bond_qubits, spins)
+            save_snapshot(qc, spin_qubits, bond_qubits, k + 1)
+            bond_ladder(qc, bond_list, bond_qubits, spins)
+
+    qc.barrier()
+    bond_ladder(qc, bond_list, bond_qubits, spins)
+    if snapshots and loop_number > 0:
+        save_snapshot(qc, spin_qubits, bond_qubits, loop_number)
+    return qc
+
+
+def save_snapshot(
+    qc: QuantumCircuit,
+    spin_qubits: QuantumRegister,
+    bond_qubits: QuantumRegister,
+    iteration: int,
+):
+    qubits = spin_qubits[:] + bond_qubits[:]
+    qc.append(SaveProbabilities(len(qubits), label=f"iteration_{iteration}"), qubits)
+
+
+def grover_sweep(
+    N: int,
+    max_loops: int = None,
+    engine: str = "aer",
+    oracle: str = "ancilla",
+    symmetric: bool = False,
+    top: int = 5,
+) -> List[dict]:
+    # One simulation of max_loops iterations (twice the optimal number by default)
+    # giving, after every iteration, the probability of measuring a solution and the
+    # most probable bond states
+    bond_list = bond_list_maker(N)
+    num_of_bonds = len(bond_list)
+    if max_loops is None:
+        max_loops = 2 * grover_loop_number(num_of_bonds, count_solutions(N, bond_list))
+    solutions = oracle_phase_mask(N, bond_list, symmetric) < 0
+
+    if engine == "aer":
+        qc = grover_circuit(N, bond_list, max_loops, oracle, symmetric, True)
+        backend = Aer.get_backend("aer_simulator_statevector")
+        data = backend.run(transpile(qc, backend)).result().data(0)
+        snapshots = (
+            data[f"iteration_{k}"].reshape(solutions.shape)
+            for k in range(max_loops + 1)
+        )
+    elif engine == "numpy":
+        snapshots = simulate_numpy_snapshots(N, bond_list, max_loops, symmetric)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    sweep = []
+    for k, probabilities in enumerate(snapshots):
+        bond_probabilities = probabilities.sum(axis=1)
+        most_probable = np.argsort(bond_probabilities)[::-1][:top]
+        sweep.append(
+            {
+                "iteration": k,
+                "success_probability": float(probabilities[solutions].sum()),
+                "bond_states": [
+                    (np.binary_repr(b, num_of_bonds), float(bond_probabilities[b]))
+                    for b in most_probable
+                ],
+            }
+        )
+    return sweep
+
+
+def print_sweep(sweep: List[dict]):
+    for step in sweep:
+        print(
+            f"{step['iteration']:>5}  {step['success_probability']:.6f}  "
+            + "  ".join(f"{b}: {p:.4f}" for b, p in step["bond_states"])
+        )
+
+
+def oracle_report(
+    N: int, bond_list: List[List[int]], loop_number: int, optimization_level: int = 1
+) -> dict:
+    # Depth and CX count of the whole search for each oracle, decomposed to cx + u
+    report = {}
+    for oracle in ORACLES:
+        qc = transpile(
+            grover_circuit(N, bond_list, loop_number, oracle),
+            basis_gates=["cx", "u"],
+            optimization_level=optimization_level,
+        )
+        report[oracle] = {
+            "qubits": qc.num_qubits,
+            "depth": qc.depth(),
+            "cx": qc.count_ops().get("cx", 0),
+        }
+    return report
+
+
+def print_oracle_report(report: dict):
+    print(f"{'oracle':>10}{'qubits':>10}{'depth':>10}{'cx':>10}")
+    for oracle, stats in report.items():
+        print(f"{oracle:>10}{stats['qubits']:>10}{stats['depth']:>10}{stats['cx']:>10}")
+
+
+def spin_controls(spin_qubits: QuantumRegister, symmetric: bool) -> list:
+    # Qubit for each spin, None for spin 0 when it's fixed to 0
+    return [None] + spin_qubits[:] if symmetric else spin_qubits[:]
+
+
+def transpiled_grover_circuit(
+    N: int,
+    bond_list: List[List[int]],
+    loop_number: int,
+    backend,
+    optimization_level: int = 1,
+    oracle: str = "ancilla",
+    symmetric: bool = False,
+    cache_dir: str = CIRCUIT_CACHE_DIR,
+) -> QuantumCircuit:
+    # grover_circuit transpiled for backend, loaded from the cache when it's been
+    # built before. Pass cache_dir=None to always build it
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(
+            cache_dir,
+            f"N{N}_loops{loop_number}_{oracle}{'_symmetric' if symmetric else ''}"
+            f"_{backend.name}_O{optimization_level}{CIRCUIT_CACHE_VERSIONS}",
+        )
+        try:
+            with open(path, "rb") as f:
+                qc = qpy.load(f)[0]
+            # Mark as recently used
+            os.utime(path)
+            return qc
+        except FileNotFoundError:
+            # Not cached, or evicted by another process since
+            pass
+        except Exception:
+            # Truncated or unreadable (QPY raises all sorts), so rebuild it rather
+            # than fail on it every time
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    qc = transpile(
+        grover_circuit(N, bond_list, loop_number, oracle, symmetric),
+        backend,
+        optimization_level=optimization_level,
+    )
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write then rename so other processes never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            qpy.dump(qc, f)
+        os.replace(tmp, path)
+        evict_circuit_cache(cache_dir)
+    return qc
+
+
+def evict_circuit_cache(
+    cache_dir: str = CIRCUIT_CACHE_DIR, max_bytes: int = CIRCUIT_CACHE_MAX_BYTES
+):
+    # Delete circuits transpiled by other qiskit or Aer versions, then the least
+    # recently used ones until the cache fits in max_bytes. Files deleted by another
+    # process meanwhile are skipped
+    sizes = {}
+    for path in glob.glob(os.path.join(cache_dir, "*.qpy")):
+        try:
+            if path.endswith(CIRCUIT_CACHE_VERSIONS):
+                sizes[path] = (os.path.getmtime(path), os.path.getsize(path))
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    total = sum(size for _, size in sizes.values())
+    for path in sorted(sizes, key=lambda p: sizes[p][0]):
+        if total <= max_bytes:
+            break
+        total -= sizes[path][1]
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def simulate_aer(
+    qc: QuantumCircuit, num_of_bonds: int, transpiled: bool = False
+) -> np.ndarray:
+    # Send circuit to backend to get exact mathematical state of circuit before measuring
+    backend = Aer.get_backend("aer_simulator_statevector")
+    if not transpiled:
+        qc = transpile(qc, backend)
+    qc = qc.copy()
+    qc.save_statevector()
+    result = backend.run(qc).result()
+    final_state_vector = result.get_statevector(qc)
+
+    # Get probabilities of each bond + spin state combo
+    num_of_spin_qubits = qc.qregs[0].size
+    probabilities = final_state_vector.probabilities(
+        [i for i in range(num_of_spin_qubits + num_of_bonds)]
+    )
+    return probabilities.reshape(2**num_of_bonds, 2**num_of_spin_qubits)
+
+
+def simulate_numpy(
+    N: int,
+    bond_list: List[List[int]],
+    loop_number: int,
+    symmetric: bool = False,
+    phase_mask: np.ndarray = None,
+) -> np.ndarray:
+    # Same search as the circuit, applied straight to the amplitudes of the spin and
+    # bond qubits (the multi control qubit just stays in |->). Indexed [bond, spin]
+    # so the flattened array follows qiskit's qubit ordering. phase_mask can pass in
+    # an already built oracle_phase_mask
+    num_of_bonds = len(bond_list)
+    num_of_spin_qubits = N - 1 if symmetric else N
+    state = np.full(
+        (2**num_of_bonds, 2**num_of_spin_qubits),
+        1 / np.sqrt(2 ** (num_of_spin_qubits + num_of_bonds)),
+    )
+    if phase_mask is None:
+        phase_mask = oracle_phase_mask(N, bond_list, symmetric)
+
+    for _ in range(loop_number):
+        # Oracle: negative phase on solutions
+        state *= phase_mask
+        # Diffuser: I - 2|s><s| on the bond qubits of every spin state
+        state -= 2 * state.mean(axis=0)
+
+    return np.square(state, out=state)
+
+
+def simulate_numpy_snapshots(
+    N: int, bond_list: List[List[int]], loop_number: int, symmetric: bool = False
+):
+    # simulate_numpy, yielding the [bond, spin] probabilities before the first and
+    # after every iteration
+    num_of_bonds = len(bond_list)
+    num_of_spin_qubits = N - 1 if symmetric else N
+    state = np.full(
+        (2**num_of_bonds, 2**num_of_spin_qubits),
+        1 / np.sqrt(2 ** (num_of_spin_qubits + num_of_bonds)),
+    )
+    phase_mask = oracle_phase_mask(N, bond_list, symmetric)
+
+    yield np.square(state)
+    for _ in range(loop_number):
+        state *= phase_mask
+        state -= 2 * state.mean(axis=0)
+        yield np.square(state)
+
+
+def oracle_phase_mask(
+    N: int, bond_list: List[List[int]], symmetric: bool = False
+) -> np.ndarray:
+    # Diagonal of SG_oracle on the [bond, spin] amplitudes. For each spin state the
+    # only solution sets every bond to 1 when its spins match and 0 when they don't
+    num_of_spin_states = 2 ** (N - 1) if symmetric else 2**N
+    columns = np.arange(num_of_spin_states)
+    # Fixing spin 0 to 0 shifts the remaining spins up one bit
+    spin_states = columns << 1 if symmetric else columns
+    spin_bits = (spin_states[:, None] >> np.arange(N)) & 1
+    solution_bonds = solution_bond_bits(spin_bits, bond_list) @ (
+        1 << np.arange(len(bond_list))
+    )
+
+    phase_mask = np.ones((2 ** len(bond_list), num_of_spin_states))
+    phase_mask[solution_bonds, columns] = -1
+    return phase_mask
+
+
+def solution_bond_bits(spin_bits: np.ndarray, bond_list: List[List[int]]) -> np.ndarray:
+    # The bond state that solves each spin state: bond i is 1 (ferromagnetic) when its
+    # two spins match and 0 when they don't. spin_bits[:, j] is spin j, the result's
+    # column i is bond i
+    clauses = np.array(bond_list)
+    return 1 - (spin_bits[:, clauses[:, 0]] ^ spin_bits[:, clauses[:, 1]])
+
+
+def consolidate(
+    probabilities: np.ndarray, N: int, num_of_bonds: int, symmetric: bool = False
+) -> dict:
+    # Consolidate most probable bonds and their solution spin states from the
+    # [bond, spin] probabilities. Bitstrings are only built for what passes the threshold
+    probabilities = np.reshape(probabilities, (2**num_of_bonds, -1))
+    if symmetric:
+        # Each probability is shared with the global spin flip partner
+        probabilities = probabilities / 2
+    bond_states, spin_states = np.nonzero(probabilities > PROBABILITY_THRESHOLD)
+    kept = probabilities[bond_states, spin_states]
+
+    if symmetric:
+        # Put spin 0 (fixed to 0) back in and add the flipped states
+        spin_states = spin_states << 1
+        bond_states = np.concatenate((bond_states, bond_states))
+        spin_states = np.concatenate((spin_states, spin_states ^ (2**N - 1)))
+        kept = np.concatenate((kept, kept))
+        order = np.lexsort((spin_states, bond_states))
+        bond_states, spin_states, kept = (
+            bond_states[order],
+            spin_states[order],
+            kept[order],
+        )
+
+    output_obj = {}
+    if len(kept) == 0:
+        return output_obj
+    unique_bonds, starts = np.unique(bond_states, return_index=True)
+    totals = np.add.reduceat(kept, starts)
+    for bond_state, group, total in zip(
+        unique_bonds, np.split(spin_states, starts[1:]), totals
+    ):
+        output_obj[np.binary_repr(bond_state, num_of_bonds)] = {
+            "probability": total,
+            "spin_states": [np.binary_repr(s, N) for s in group],
+        }
+    return output_obj
+
+
+def count_solutions(
+    N: int, bond_list: List[List[int]], method: str = "classical"
+) -> int:
+    # Number of bond states marked by SG_oracle for each spin state. The diffuser only
+    # acts on the bond qubits, so this (not the total over all spin states) sets the
+    # rotation angle of each Grover iteration. The exact classical count is cheaper
+    # than simulating the search itself for every N; quantum counting is only a
+    # demonstration for small N
+    if method == "classical":
+        return classical_count(N, bond_list)
+    if method == "quantum":
+        return quantum_count(N, bond_list)
+    raise ValueError(f"Unknown counting method: {method}")
+
+
+def classical_count(N: int, bond_list: List[List[int]]) -> int:
+    # Exact count: evaluate the oracle condition (every bond qubit XOR its two spins is 1)
+    # for every bond state of every spin state
+    bond_states = np.arange(2 ** len(bond_list))
+    num_marked = 0
+    for spin_state in range(2**N):
+        marked = np.ones(len(bond_states), dtype=bool)
+        for i, clause in enumerate(bond_list):
+            parity = ((spin_state >> clause[0]) ^ (spin_state >> clause[1])) & 1
+            marked &= ((bond_states >> i) & 1) ^ parity == 1
+        num_marked += np.count_nonzero(marked)
+    return num_marked // 2**N
+
+
+def counting_qubits_needed(num_of_bonds: int) -> int:
+    # A single solution has sin(theta)^2 = 2^-(number of bonds), and t counting qubits
+    # resolve theta to within pi / 2^(t + 1). Resolving the count to within half a
+    # solution takes 2^t > 2 * pi * 2^(number of bonds / 2)
+    return int(np.ceil(num_of_bonds / 2 + np.log2(2 * np.pi)))
+
+
+def quantum_count(
+    N: int, bond_list: List[List[int]], counting_qubits: int = None
+) -> int:
+    # Quantum counting: phase estimation of the Grover iterate. Our diffuser is
+    # I - 2|s><s|, so the eigenphases are pi +- 2*theta with
+    # sin(theta)^2 = (number of solutions) / 2^(number of bonds).
+    # The counting register is sized from the number of bonds, and we refuse to
+    # estimate with fewer counting qubits than that or more than MAX_COUNTING_QUBITS
+    num_of_bonds = len(bond_list)
+    needed = counting_qubits_needed(num_of_bonds)
+    if counting_qubits is None:
+        counting_qubits = needed
+    if counting_qubits < needed:
+        raise ValueError(
+            f"{counting_qubits} counting qubits can't resolve the solution count "
+            f"for {num_of_bonds} bonds, at least {needed} are needed"
+        )
+    if counting_qubits > MAX_COUNTING_QUBITS:
+        raise ValueError(
+            f"Quantum counting for {num_of_bonds} bonds needs {counting_qubits} "
+            f"counting qubits, more than the {MAX_COUNTING_QUBITS} we simulate; "
+            "use classical_count"
+        )
+    count_qubits = QuantumRegister(counting_qubits, name="count")
+    spin_qubits = QuantumRegister(N, name="spin")
+    bond_qubits = QuantumRegister(num_of_bonds, name="bond")
+    multi_control_qubit = QuantumRegister(1, name="multi")
+    qc = QuantumCircuit(count_qubits, spin_qubits, bond_qubits, multi_control_qubit)
+
+    qc.x(multi_control_qubit)
+    qc.h(multi_control_qubit)
+    qc.h(count_qubits)
+    qc.h(spin_qubits)
+    qc.h(bond_qubits)
+
+    # Controlled Grover iterations, 2^j of them on the jth counting qubit. The
+    # controlled iterate is transpiled once and copied, transpiling all 2^t - 1
+    # copies is far slower than simulating them
+    backend = Aer.get_backend("aer_simulator_statevector")
+    iterate = QuantumCircuit(1 + N + num_of_bonds + 1)
+    iterate.append(grover_iterate(N, bond_list).control(), iterate.qubits)
+    iterate = transpile(iterate, backend)
+    for j in range(counting_qubits):
+        for _ in range(2**j):
+            qc.compose(
+                iterate,
+                [count_qubits[j]]
+                + spin_qubits[:]
+                + bond_qubits[:]
+                + multi_control_qubit[:],
+                inplace=True,
+            )
+    qc.append(QFT(counting_qubits, inverse=True).to_gate(), count_qubits)
+
+    qc.save_statevector()
+    result = backend.run(transpile(qc, backend, optimization_level=0)).result()
+    probabilities = result.get_statevector(qc).probabilities(
+        [i for i in range(counting_qubits)]
+    )
+
+    phase = np.argmax(probabilities) / 2**counting_qubits
+    return max(1, int(round(2**num_of_bonds * np.cos(np.pi * phase) ** 2)))
+
+
+def grover_loop_number(
+    num_of_bonds: int,
+    num_of_solutions: int,
+    min_success: float = MIN_SUCCESS_PROBABILITY,
+) -> int:
+    # Each iteration rotates by 2*theta, so after k loops a solution is measured with
+    # probability sin((2k + 1) * theta)^2. Take the fewest loops reaching min_success,
+    # or the best loop count within the first two periods if none does
+    theta = np.arcsin(np.sqrt(num_of_solutions / 2**num_of_bonds))
+    loops = np.arange(int(np.ceil(np.pi / theta)) + 1)
+    success = np.sin((2 * loops + 1) * theta) ** 2
+    if np.any(success >= min_success):
+        return int(loops[np.argmax(success >= min_success)])
+    return int(loops[np.argmax(success)])
+
+
+def grover_iterate(N: int, bond_list: List[List[int]]):
+    # A single oracle + diffuser round on the spin, bond and multi control qubits
+    num_of_bonds = len(bond_list)
+    spin_qubits = QuantumRegister(N, name="spin")
+    bond_qubits = QuantumRegister(num_of_bonds, name="bond")
+    multi_control_qubit = QuantumRegister(1, name="multi")
+    qc = QuantumCircuit(spin_qubits, bond_qubits, multi_control_qubit)
+    SG_oracle(qc, bond_list, bond_qubits, multi_control_qubit)
+    qc.append(diffuser(num_of_bonds), bond_qubits)
+    # Barriers can't be converted to a gate
+    G = RemoveBarriers()(qc).to_gate()
+    G.name = "$G$"
+    return G
+
+
+def bond_ladder(
+    qc: QuantumCircuit,
+    bond_list: List[List[int]],
+    bond_qubits: QuantumRegister,
+    spin_qubits: list = None,
+):
+    # spin_qubits maps each spin to its qubit, by default the first N qubits
+    if spin_qubits is None:
+        spin_qubits = [i for i in range(bond_list[-1][1] + 1)]
+    for i, clause in enumerate(bond_list):
+        XOR(qc, spin_qubits[clause[0]], spin_qubits[clause[1]], bond_qubits[i])
+
+
+def SG_phase_oracle(qc: QuantumCircuit, bond_qubits: QuantumRegister):
+    # Multi-controlled Z: negative phase on |11..1> of the bond qubits, no ancilla
+    qc.h(bond_qubits[-1])
+    qc.mcx(bond_qubits[:-1], bond_qubits[-1])
+    qc.h(bond_qubits[-1])
+
+
 def XOR(qc, a, b, output):
-    qc.cx(a, output)
-    qc.cx(b, output)
+    # A spin fixed to 0 has no qubit (None) and leaves the output alone
+    if a is not None:
+        qc.cx(a, output)
+    if b is not None:
+        qc.cx(b, output)
     qc.barrier()
 
 
@@ -182,20 +981,18 @@ def SG_oracle(
     bond_list: List[List[int]],
     bond_qubits: QuantumRegister,
     multi_control_qubit: QuantumRegister,
+    spin_qubits: list = None,
 ):
     # Add an XOR to each bond qubit such that if bond_i connects spin_a
     # and spin_b, the bond_i qubit will become spin_a XOR spin_b
-    for i, clause in enumerate(bond_list):
-        XOR(qc, clause[0], clause[1], bond_qubits[i])
+    bond_ladder(qc, bond_list, bond_qubits, spin_qubits)
 
     # Apply X gate to 'multicontrol' qubit if all clauses are satisfied
     # This adds a negative phase to solution items only
     qc.mcx(bond_qubits, multi_control_qubit)
 
     # Add the exact same XOR gates to "uncompute" and return bonds to original state
-    for i, clause in enumerate(bond_list):
-        XOR(qc, clause[0], clause[1], bond_qubits[i])
-        i += 1
+    bond_ladder(qc, bond_list, bond_qubits, spin_qubits)
 
 
 if __name__ == "__main__":
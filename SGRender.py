@@ -0,0 +1,123 @@
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Union
+
+FORMATS = ("png", "svg")
+
+# This process's offscreen Qt application and its viewer windows, one for each N
+_app = None
+_windows = {}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description="Render bond configurations to images without opening windows"
+    )
+    parser.add_argument(
+        "-input",
+        type=str,
+        help="Results of SGFrustration -output (JSON): render every bond "
+        "configuration found, with its first spin state",
+    )
+    parser.add_argument("-N", type=int, help="Number of spins (with -BC)")
+    parser.add_argument("-BC", type=str, nargs="+", help="Bond configurations")
+    parser.add_argument("-format", choices=FORMATS, default="png")
+    parser.add_argument(
+        "-output", type=str, default=".", help="Directory to write the images to"
+    )
+    parser.add_argument("-workers", type=int, default=1, help="Worker processes")
+    args = parser.parse_args(argv)
+
+    if args.input is not None:
+        with open(args.input) as f:
+            results = json.load(f)
+        jobs = [(result["N"], result["output"]) for result in results]
+    elif args.N is not None and args.BC:
+        jobs = [(args.N, args.BC)]
+    else:
+        parser.error("either -input or -N and -BC are required")
+
+    for N, configurations in jobs:
+        for path in render(configurations, N, args.output, args.format, args.workers):
+            print(path)
+
+
+def render(
+    configurations: Union[Dict[str, dict], Iterable[str]],
+    N: int,
+    directory: str = ".",
+    fmt: str = "png",
+    workers: int = 1,
+) -> List[str]:
+    # Draws each bond configuration the way SGViz shows it into
+    # directory/N{N}_{bond configuration}.{fmt} and returns the paths.
+    # configurations is either an output_obj of SGFrustration, whose first spin
+    # state of each configuration is drawn, or just bond configurations, drawn in
+    # their first ground state. With workers > 1 the images are split between
+    # processes with an offscreen Qt each
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(configurations, dict):
+        spin_states = [
+            entry["spin_states"][0] if entry["spin_states"] else None
+            for entry in configurations.values()
+        ]
+    else:
+        configurations = list(configurations)
+        spin_states = [None] * len(configurations)
+    paths = [
+        os.path.join(directory, f"N{N}_{bond_config}.{fmt}")
+        for bond_config in configurations
+    ]
+    jobs = [[N] * len(paths), list(configurations), spin_states, paths]
+
+    if workers > 1:
+        # Spawned, not forked: a forked Qt can inherit state it can't use
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        ) as pool:
+            chunksize = max(1, len(paths) // (4 * workers))
+            return list(pool.map(render_one, *jobs, chunksize=chunksize))
+    init_worker()
+    return [render_one(*job) for job in zip(*jobs)]
+
+
+def init_worker():
+    # Start (or reuse) this process's Qt application, offscreen unless one is
+    # already running
+    global _app
+    from PyQt5.QtWidgets import QApplication
+
+    _app = QApplication.instance()
+    if _app is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        _app = QApplication([])
+
+
+def render_one(N: int, bond_config: str, spin_state: str, path: str) -> str:
+    # spin_state is a bitstring like those of SGFrustration (spin 0 rightmost), or
+    # None for the first ground state
+    import SGViz
+
+    cnfg = None if spin_state is None else int(spin_state[::-1], 2)
+    window = _windows.get(N)
+    if window is None:
+        window = SGViz.Window(["-N", str(N), "-loadBC", "-BC", bond_config])
+        _windows[N] = window
+        # Let its first load finish rather than leave a thread running
+        for worker in list(window.workers):
+            worker.wait()
+        _app.processEvents()
+    window.setCouplings(N, bond_config, cnfg, wait=True)
+    window.saveImage(path)
+    return path
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+
+import tfim
+
+# The last spins of the branch and bound search are enumerated as one block of
+# 2^LEAF_BITS states instead of being branched on one at a time
+LEAF_BITS = 12
+
+# Energies closer than this count as degenerate
+TOLERANCE = 1e-9
+
+METHODS = ("exact", "anneal", "tempering")
+
+# Default inverse temperatures of the Monte Carlo methods, in units of one over
+# the typical local field (about where the SK spin glass transition sits)
+BETA_RANGE = (0.2, 5.0)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description="Exact ground states of a Sherrington-Kirkpatrick spin glass"
+    )
+    parser.add_argument("-N", type=int, required=True, help="Number of spins")
+    parser.add_argument("-seed", type=int, default=0, help="Coupling instance seed")
+    parser.add_argument(
+        "-dist", type=str, default="bimodal", help="Coupling distribution"
+    )
+    parser.add_argument("-method", choices=METHODS, default="exact")
+    parser.add_argument("-workers", type=int, default=1, help="Worker processes")
+    parser.add_argument(
+        "-sweeps", type=int, default=1000, help="Monte Carlo sweeps (at most)"
+    )
+    parser.add_argument(
+        "-replicas", type=int, default=16, help="Independent Monte Carlo replicas"
+    )
+    parser.add_argument(
+        "-patience",
+        type=int,
+        help="Stop Monte Carlo after this many sweeps without a better energy",
+    )
+    args = parser.parse_args(argv)
+    if args.sweeps < 1:
+        parser.error("-sweeps must be at least 1")
+
+    J = tfim.Jij_instance(args.N, 1, args.dist, args.seed, False)
+    if args.method == "exact":
+        result = branch_and_bound(J, workers=args.workers)
+    elif args.method == "anneal":
+        schedule = annealing_schedule(J, args.sweeps)
+        result = anneal(J, schedule, args.replicas, args.seed, args.patience)
+    else:
+        result = parallel_tempering(
+            J,
+            replicas=args.replicas,
+            sweeps=args.sweeps,
+            seed=args.seed,
+            patience=args.patience,
+        )
+    print(json.dumps(result, indent=4, default=np.ndarray.tolist))
+
+
+def branch_and_bound(
+    J: np.ndarray, workers: int = 1, leaf_bits: int = LEAF_BITS, tol: float = TOLERANCE
+) -> dict:
+    # Exact SK ground states (energy -JZZ, as in SGViz) for couplings J as made by
+    # tfim.Jij_instance. Spins are assigned one at a time, strongest coupled first,
+    # and a branch is dropped once its energy so far minus the most the unassigned
+    # spins could still lower it (their local fields plus the couplings among them)
+    # is above the best energy found. The first spin is fixed up since every state
+    # has a flipped partner with the same energy, and subtrees are split between
+    # workers processes. Returns the ground state energy, every ground state as an
+    # IsingBasis index (flipped partners included), the nodes visited and the time
+    start = time.perf_counter()
+    K = tfim.coupling_matrix(J)
+    N = len(K)
+
+    # Strongest coupled spins first tightens the bound early
+    order = np.argsort(-np.abs(K).sum(axis=1), kind="stable")
+    K = K[np.ix_(order, order)]
+
+    # Start from a good heuristic energy so pruning starts right away
+    upper = greedy_descent(K)[0] + tol
+
+    # One subtree per assignment of the spins after the fixed one, a few per worker
+    branched = N - min(leaf_bits, N - 1)
+    split = 0 if workers == 1 else min(branched - 1, int(np.ceil(np.log2(4 * workers))))
+    prefixes = [
+        [1] + [1 - 2 * ((p >> b) & 1) for b in range(split)] for p in range(2**split)
+    ]
+    args = [(K, prefix, upper, leaf_bits, tol) for prefix in prefixes]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(branch_and_bound_subtree, *zip(*args)))
+    else:
+        results = [branch_and_bound_subtree(*a) for a in args]
+
+    # The heuristic state lies in one of the subtrees, so at least one found states
+    energy = min(r[0] for r in results if r[1])
+    states = [s for r in results if r[1] and r[0] <= energy + tol for s in r[1]]
+    # Back to the original spin order, and add the flipped partners
+    spins = np.empty((len(states), N), dtype=int)
+    spins[:, order] = np.array(states)
+    spins = np.concatenate((spins, -spins))
+    return {
+        "energy": energy,
+        "ground_states": sorted(ising_basis(N).indices(spins).tolist()),
+        "nodes": sum(r[2] for r in results),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def branch_and_bound_subtree(
+    K: np.ndarray, prefix: List[int], upper: float, leaf_bits: int, tol: float
+):
+    # Depth first search below the spins fixed in prefix. Returns the lowest energy
+    # found (upper if nothing beats it), the states within tol of it and the nodes
+    # visited
+    N = len(K)
+    tail = min(leaf_bits, N - 1)
+    branched = N - tail
+
+    # Largest total of the couplings among spins d, ..., N-1 for every depth d
+    abs_K = np.abs(np.triu(K, 1))
+    remaining = np.array([abs_K[d:, d:].sum() for d in range(N + 1)])
+
+    # Every state of the tail spins with the energy of their own couplings
+    tail_spins = ising_basis(tail).spin_states(np.arange(2**tail))
+    tail_energy = -tfim.JZZ_K(tail_spins, K[branched:, branched:])
+
+    spins = np.zeros(N)
+    fields = np.zeros(N)
+    energy = 0.0
+    for d, s in enumerate(prefix):
+        energy -= s * fields[d]
+        fields += s * K[:, d]
+        spins[d] = s
+
+    best = upper
+    solutions = []
+    nodes = 0
+
+    def descend(d, energy):
+        nonlocal best, solutions, nodes, fields
+        nodes += 1
+        if d == branched:
+            energies = energy - tail_spins @ fields[branched:] + tail_energy
+            lowest = energies.min()
+            if lowest < best - tol:
+                solutions = []
+            best = min(best, lowest)
+            for t in np.flatnonzero(energies <= best + tol):
+                solutions.append(np.concatenate((spins[:branched], tail_spins[t])))
+            return
+
+        bound = energy - np.abs(fields[d:]).sum() - remaining[d]
+        if bound > best + tol:
+            return
+        # Try the spin along its field first, it lowers the energy
+        field = fields[d]
+        for s in (1, -1) if field >= 0 else (-1, 1):
+            spins[d] = s
+            fields += s * K[:, d]
+            descend(d + 1, energy - s * field)
+            fields -= s * K[:, d]
+        spins[d] = 0
+
+    descend(len(prefix), energy)
+    return best, solutions, nodes
+
+
+def greedy_descent(K: np.ndarray, restarts: int = 64, seed: int = 0):
+    # Single spin flip descent from random states, all restarts at once. Returns the
+    # lowest energy reached and its spins
+    rng = np.random.default_rng(seed)
+    spins = rng.choice([-1.0, 1.0], size=(restarts, len(K)))
+    fields = spins @ K
+    while True:
+        # Flipping spin i changes the energy by 2 s_i h_i
+        gains = 2 * spins * fields
+        i = gains.argmin(axis=1)
+        improving = np.flatnonzero(gains[np.arange(restarts), i] < -TOLERANCE)
+        if len(improving) == 0:
+            break
+        flipped = i[improving]
+        s = spins[improving, flipped]
+        spins[improving, flipped] = -s
+        fields[improving] -= 2 * s[:, None] * K[flipped]
+    energies = -0.5 * np.einsum("ri,ri->r", spins, fields)
+    best = energies.argmin()
+    return energies[best], spins[best]
+
+
+def annealing_schedule(
+    J: np.ndarray,
+    sweeps: int,
+    beta_range: tuple = BETA_RANGE,
+    kind: str = "geometric",
+) -> np.ndarray:
+    # Inverse temperature of each annealing sweep, from beta_range[0] to
+    # beta_range[1] (in units of one over the typical local field of J)
+    scale = 1 / field_scale(tfim.coupling_matrix(J))
+    if kind == "geometric":
+        return scale * np.geomspace(*beta_range, sweeps)
+    elif kind == "linear":
+        return scale * np.linspace(*beta_range, sweeps)
+    raise ValueError(f"Unknown schedule: {kind}")
+
+
+def temperature_ladder(
+    J: np.ndarray, count: int = 16, beta_range: tuple = BETA_RANGE
+) -> np.ndarray:
+    # Geometrically spaced inverse temperatures for parallel tempering
+    return np.geomspace(*beta_range, count) / field_scale(tfim.coupling_matrix(J))
+
+
+def field_scale(K: np.ndarray) -> float:
+    # Root mean square local field of a random state
+    return np.sqrt((K**2).sum() / len(K))
+
+
+def anneal(
+    J: np.ndarray,
+    schedule: np.ndarray,
+    replicas: int = 16,
+    seed: int = None,
+    patience: int = None,
+    target: float = None,
+) -> dict:
+    # Simulated annealing of replicas independent chains at once, one Metropolis
+    # sweep at each inverse temperature of schedule (see annealing_schedule)
+    chains = MetropolisChains(J, replicas, 1, seed)
+    return chains.run(
+        lambda sweep: schedule[sweep], len(schedule), False, patience, target
+    )
+
+
+def parallel_tempering(
+    J: np.ndarray,
+    betas: np.ndarray = None,
+    replicas: int = 16,
+    sweeps: int = 1000,
+    seed: int = None,
+    patience: int = None,
+    target: float = None,
+) -> dict:
+    # Parallel tempering: every replica is a ladder of chains at the inverse
+    # temperatures betas (temperature_ladder by default) whose neighbours try to
+    # swap states after every sweep
+    if betas is None:
+        betas = temperature_ladder(J)
+    chains = MetropolisChains(J, replicas, len(betas), seed)
+    return chains.run(lambda sweep: betas, sweeps, True, patience, target)
+
+
+class MetropolisChains:
+    """Spin states of replicas x temperatures Metropolis chains on one set of
+    couplings, with their local fields and energies (-JZZ) kept up to date"""
+
+    def __init__(self, J: np.ndarray, replicas: int, temperatures: int, seed=None):
+        self.K = tfim.coupling_matrix(J)
+        self.N = len(self.K)
+        self.rng = np.random.default_rng(seed)
+        self.spins = self.rng.choice([-1.0, 1.0], size=(replicas, temperatures, self.N))
+        self.fields = self.spins @ self.K
+        self.energies = -0.5 * np.einsum("rti,rti->rt", self.spins, self.fields)
+
+        # Lowest energy each replica has reached (at any temperature) and its spins
+        self.best_energies = self.energies.min(axis=1)
+        self.best_spins = self.spins[np.arange(replicas), self.energies.argmin(axis=1)]
+
+    def sweep(self, betas: np.ndarray):
+        # One Metropolis update of every spin in turn, in every chain at once.
+        # betas is one inverse temperature per temperature (or a single one)
+        betas = np.broadcast_to(betas, self.energies.shape[1:])
+        for i in range(self.N):
+            s = self.spins[..., i]
+            # Flipping spin i changes the energy by 2 s_i h_i
+            delta = 2 * s * self.fields[..., i]
+            accept = self.rng.random(s.shape) < np.exp(np.minimum(0, -betas * delta))
+            change = np.where(accept, -2 * s, 0)
+            self.fields += change[..., None] * self.K[i]
+            self.energies += np.where(accept, delta, 0)
+            self.spins[..., i] += change
+
+    def exchange(self, betas: np.ndarray, offset: int):
+        # Replica exchange between temperatures t and t+1 for t = offset, offset+2,
+        # ..., accepted with probability min(1, exp((b[t+1] - b[t])(E[t+1] - E[t])))
+        t = np.arange(offset, len(betas) - 1, 2)
+        delta = (betas[t + 1] - betas[t]) * (
+            self.energies[:, t + 1] - self.energies[:, t]
+        )
+        accept = self.rng.random(delta.shape) < np.exp(np.minimum(0, delta))
+        order = np.broadcast_to(np.arange(len(betas)), self.energies.shape).copy()
+        r, pair = np.nonzero(accept)
+        order[r, t[pair]] += 1
+        order[r, t[pair] + 1] -= 1
+        self.spins = np.take_along_axis(self.spins, order[..., None], axis=1)
+        self.fields = np.take_along_axis(self.fields, order[..., None], axis=1)
+        self.energies = np.take_along_axis(self.energies, order, axis=1)
+
+    def update_best(self) -> bool:
+        # Record replicas that reached a new lowest energy, True if any did
+        lowest = self.energies.argmin(axis=1)
+        replicas = np.arange(len(lowest))
+        energies = self.energies[replicas, lowest]
+        better = energies < self.best_energies - TOLERANCE
+        self.best_energies[better] = energies[better]
+        self.best_spins[better] = self.spins[replicas[better], lowest[better]]
+        return better.any()
+
+    def run(self, betas, sweeps, exchange, patience=None, target=None) -> dict:
+        # Sweep with the inverse temperatures betas(sweep) until sweeps are done, or
+        # patience sweeps pass without a better energy, or target is reached. With no
+        # sweeps the result is just the random starting states
+        start = time.perf_counter()
+        since_better = 0
+        done = 0
+        while done < sweeps:
+            self.sweep(betas(done))
+            if exchange:
+                self.exchange(betas(done), done % 2)
+            done += 1
+            since_better = 0 if self.update_best() else since_better + 1
+            if target is not None and self.best_energies.min() <= target + TOLERANCE:
+                break
+            if patience is not None and since_better >= patience:
+                break
+        return self.result(done, time.perf_counter() - start)
+
+    def result(self, sweeps: int, seconds: float) -> dict:
+        # Best energy and states over all replicas, in the form of branch_and_bound,
+        # plus the best energy and state (IsingBasis index) of each replica
+        energy = self.best_energies.min()
+        best = self.best_spins[self.best_energies <= energy + TOLERANCE]
+        basis = ising_basis(self.N)
+        ground_states = set(basis.indices(np.concatenate((best, -best))).tolist())
+        return {
+            "energy": energy,
+            "ground_states": sorted(ground_states),
+            "energies": self.best_energies,
+            "states": basis.indices(self.best_spins).tolist(),
+            "sweeps": sweeps,
+            "seconds": seconds,
+        }
+
+
+def ising_basis(N: int) -> tfim.IsingBasis:
+    return tfim.IsingBasis(tfim.Lattice([N]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,28 @@
 import numpy as np
 import random
 import tfim
+import SGSolvers
 import itertools as it
 import argparse
 
-import threading
 import sys, os
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtWidgets import QMainWindow, QWidget, QLabel, QLineEdit
-from PyQt5.QtWidgets import QPushButton
-from PyQt5.QtCore import QSize, QPointF
+from PyQt5.QtWidgets import QPushButton, QProgressBar
+from PyQt5.QtCore import QSize, QPointF, QLineF, QThread, pyqtSignal
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPainter, QBrush, QPen, QFont, QColor
+from PyQt5.QtGui import QPainter, QBrush, QPen, QFont, QColor, QPixmap
+from PyQt5.QtSvg import QSvgGenerator
 from PyQt5.QtWidgets import QApplication
 
+# Past this many spins the full spectrum is too big, and the viewer shows the lowest
+# states simulated annealing finds instead of the exact ground states
+SPECTRUM_MAX_N = 24
+
+# The application and viewer kept by browse between calls
+_app = None
+_browser = None
+
 
 def main():
     App = QApplication(sys.argv)
@@ -22,7 +31,7 @@ def main():
 
 
 class Window(QMainWindow):
-    def __init__(self):
+    def __init__(self, argv=None):
         QMainWindow.__init__(self)
 
         parser = argparse.ArgumentParser(
@@ -35,7 +44,7 @@ class Window(QMainWindow):
         parser.add_argument(
             "-BC", type=str, default="101011", help="Bond Configuration"
         )
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
 
         # Set these to True to see bipartitions or Energy info, respectively
         ######################################################################
@@ -58,30 +67,35 @@ class Window(QMainWindow):
         # Set initial parameters
         self.N = args.N
         self.seed = 0
-        self.G = tfim.Jij_instance(self.N, 1, "bimodal", self.seed, True)
-        if self.loadBC:
-            self.Jij = BCtoJij(args.N, str(self.BC))
-            self.G = JijtoG(self.Jij, self.N)
-        else:
-            self.Jij = makeJij(self.G, self.N)
-
-        if self.show_Ens:
-            self.lattice = tfim.Lattice([self.N])
-            self.basis = tfim.IsingBasis(self.lattice)
-            self.JZZ = tfim.JZZ_SK(self.basis, self.G)
-            self.ea = -(self.JZZ.diagonal())
-            self.gs = np.where(self.ea == self.ea.min())[0]
-
-        self.cnfg = self.gs[0]
-        self.configuration = list(map(int, list(bin(self.cnfg)[2:].zfill(self.N))))
+        # Filled in by the background load of the couplings (setCouplings)
+        self.couplings_key = None
+        self.worker = None
+        self.workers = set()
+        self.gs = []
+        self.spins = None
+        self.configuration = []
+        # Bond configurations being browsed (setConfigurations) and the couplings
+        # precomputed for them
+        self.configurations = []
+        self.couplingsCache = {}
+        self.precomputer = None
         self.center = (500, 375)
         self.coordList = spinCoords(self.N, self.center, 290)
-        combos = list(it.combinations([i for i in range(int(self.N))], int(self.N / 2)))
+        # There are far too many bipartitions to list them for large N
         self.permlist = []
-        for i in range(int(len(combos) / 2)):
-            self.permlist.append(combos[i] + combos[int(len(combos)) - 1 - i])
+        if self.show_bps:
+            combos = list(
+                it.combinations([i for i in range(int(self.N))], int(self.N / 2))
+            )
+            for i in range(int(len(combos) / 2)):
+                self.permlist.append(combos[i] + combos[int(len(combos)) - 1 - i])
         self.pi = 0
-        self.p = self.permlist[self.pi]
+        self.p = self.permlist[self.pi] if self.show_bps else ()
+
+        # Cached pixmaps of the bonds and of the spins and labels (see layer), off
+        # when painting to SVG
+        self.layers = {}
+        self.cacheLayers = True
 
         self.clear = False
 
@@ -117,14 +131,28 @@ class Window(QMainWindow):
         self.Resizebutton.clicked.connect(self.resizeMethod)
         self.BCLabel = QLabel(self)
         self.CLLabel = QLabel(self)
+        self.progressBar = QProgressBar(self)
+        self.progressBar.hide()
+        # Only made once configurations are browsed
+        self.browseLabel = None
 
         self.editLabels()
 
         self.InitWindow()
+        self.setCouplings(self.N, self.BC)
 
     def keyPressEvent(self, qKeyEvent):
         if qKeyEvent.key() == QtCore.Qt.Key_Return:
             self.clickMethod()
+        elif self.configurations and qKeyEvent.key() in (Qt.Key_Down, Qt.Key_Up):
+            step = 1 if qKeyEvent.key() == Qt.Key_Down else -1
+            self.showConfiguration((self.ci + step) % len(self.configurations))
+        elif self.configurations and qKeyEvent.key() in (
+            Qt.Key_PageDown,
+            Qt.Key_PageUp,
+        ):
+            step = 1 if qKeyEvent.key() == Qt.Key_PageDown else -1
+            self.showConfiguration(self.ci, self.si + step)
 
     def InitWindow(self):
         self.setWindowTitle(self.title)
@@ -132,8 +160,13 @@ class Window(QMainWindow):
         self.show()
 
     def clickMethod(self):
-        thread = threading.Thread(target=self.DynMethod())
-        thread.start()
+        self.DynMethod()
+
+    def closeEvent(self, event):
+        for worker in list(self.workers):
+            worker.requestInterruption()
+            worker.wait()
+        QMainWindow.closeEvent(self, event)
 
     def resizeMethod(self):
         self.width = self.size().width()
@@ -181,29 +214,12 @@ class Window(QMainWindow):
 
         cs = self.cEdit.text()
         if len(cs) > 0:
-            change = True
-            c = int(cs)
-            if c != self.cnfg:
-                self.cnfg = c
-
-        if change:
-            self.G = tfim.Jij_instance(self.N, 1, "bimodal", self.seed, True)
-            if self.loadBC:
-                self.Jij = BCtoJij(self.N, str(self.BC))
-                self.G = JijtoG(self.Jij, self.N)
-            else:
-                self.Jij = makeJij(self.G, self.N)
-            self.configuration = list(map(int, list(bin(self.cnfg)[2:].zfill(self.N))))
-            self.Clabel.setText("Current State: " + str(self.configuration))
-
-            if self.show_Ens:
-                self.lattice = tfim.Lattice([self.N])
-                self.basis = tfim.IsingBasis(self.lattice)
-                self.JZZ = tfim.JZZ_SK(self.basis, self.G)
-                self.ea = -(self.JZZ.diagonal())
-                self.gs = np.where(self.ea == self.ea.min())[0]
-                self.Ealabel.setText("Ground States: " + str(self.gs))
-                self.Enlabel.setText("Current Energy: " + str(self.ea[self.cnfg]))
+            # Only a new N or bond configuration needs the spectrum again, and then
+            # the state changes once it has loaded
+            self.setCouplings(self.N, self.BC, int(cs))
+            if self.worker is None:
+                self.setState(int(cs))
+                self.updateLabels()
 
         # ps = self.pEdit.text()
         # if len(ps) > 0:
@@ -214,17 +230,236 @@ class Window(QMainWindow):
 
         self.repaint()
 
+    def setCouplings(self, N, BC, cnfg=None, wait=False):
+        # Loads the couplings, spectrum and ground states in a background worker (or
+        # right away with wait), only when N or the bond configuration change, after
+        # which the state moves to cnfg (the first ground state by default). A newer
+        # load cancels the one still running
+        key = (N, BC if self.loadBC else self.seed)
+        self.pending_cnfg = cnfg
+        if key == self.couplings_key and (self.worker is None or not wait):
+            if wait:
+                self.setState(self.gs[0] if cnfg is None else cnfg)
+                self.updateLabels()
+            return
+        self.couplings_key = key
+        if self.worker is not None:
+            self.worker.requestInterruption()
+            self.worker = None
+
+        if key in self.couplingsCache:
+            self.applyCouplings(self.couplingsCache[key])
+            return
+        if wait:
+            couplings = loadCouplings(N, BC, self.loadBC, self.seed, self.show_Ens)
+            couplings["key"] = key
+            self.applyCouplings(couplings)
+            return
+        self.worker = self.startWorker([(key, N, BC)], self.couplingsLoaded)
+        self.worker.progress.connect(self.progressBar.setValue)
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+
+    def startWorker(self, jobs, loaded):
+        worker = CouplingsWorker(jobs, self.loadBC, self.seed, self.show_Ens)
+        worker.loaded.connect(loaded)
+        # Running workers are kept until they finish, even once superseded
+        self.workers.add(worker)
+        worker.finished.connect(lambda: self.workers.discard(worker))
+        worker.start()
+        return worker
+
+    def couplingsLoaded(self, couplings):
+        # Receives the result of the current CouplingsWorker on the GUI thread
+        if self.sender() is self.worker and couplings["key"] == self.couplings_key:
+            self.applyCouplings(couplings)
+
+    def couplingsPrecomputed(self, couplings):
+        # Keeps a result of the precomputing CouplingsWorker, and shows it if the
+        # current configuration is still loading
+        self.couplingsCache[couplings["key"]] = couplings
+        if self.worker is not None and couplings["key"] == self.couplings_key:
+            self.worker.requestInterruption()
+            self.applyCouplings(couplings)
+
+    def setConfigurations(self, configurations, N, start=None):
+        # Browses bond configurations: an output_obj of SGFrustration (bond
+        # configuration -> spin states) or just a list of them, starting from start.
+        # Up/Down step through the configurations and PageUp/PageDown through their
+        # spin states (or ground states). Every configuration's couplings and ground
+        # states are precomputed in the background so switching is instant
+        if isinstance(configurations, dict):
+            self.configurations = [
+                (BC, [int(s[::-1], 2) for s in entry["spin_states"]])
+                for BC, entry in configurations.items()
+            ]
+        else:
+            self.configurations = [(BC, []) for BC in configurations]
+        self.loadBC = True
+        self.browseN = N
+        ci = [BC for BC, _ in self.configurations].index(start) if start else 0
+
+        # The configurations after start first, as they're the likeliest next
+        if self.precomputer is not None:
+            self.precomputer.requestInterruption()
+        order = self.configurations[ci:] + self.configurations[:ci]
+        jobs = [((N, BC), N, BC) for BC, _ in order]
+        jobs = [job for job in jobs if job[0] not in self.couplingsCache]
+        self.precomputer = self.startWorker(jobs, self.couplingsPrecomputed)
+        if self.browseLabel is None:
+            self.browseLabel = QLabel(self)
+            self.setWindowTitle(
+                self.title + " - Up/Down: configuration, PageUp/PageDown: state"
+            )
+            self.editLabels()
+            self.browseLabel.show()
+        self.showConfiguration(ci)
+
+    def showConfiguration(self, ci, si=0):
+        # Shows bond configuration ci of the ones browsed in its spin state si
+        self.ci = ci
+        BC, states = self.configurations[ci]
+        self.si = si % len(states) if states else si
+        self.setCouplings(self.browseN, BC, states[self.si] if states else None)
+        if self.worker is not None and not states:
+            # Its ground states aren't known yet, so the first one it is
+            self.si = 0
+        elif self.worker is None:
+            if not states:
+                self.si %= len(self.gs)
+            self.setState(states[self.si] if states else self.gs[self.si])
+            self.updateLabels()
+        self.browseLabel.setText(
+            f"Configuration {ci + 1}/{len(self.configurations)}, state {self.si + 1}"
+        )
+        self.repaint()
+
+    def applyCouplings(self, couplings):
+        self.worker = None
+        self.progressBar.hide()
+        # Sizes and the bond list follow N
+        resized = self.N != couplings["N"]
+        self.N = couplings["N"]
+        self.BC = couplings["BC"]
+        self.G = couplings["G"]
+        self.Jij = couplings["Jij"]
+        self.K = couplings["K"]
+        self.lattice = couplings["lattice"]
+        self.basis = couplings["basis"]
+        if self.show_Ens:
+            self.ea = couplings["ea"]
+            self.gs = couplings["gs"]
+            self.exact = couplings["exact"]
+
+        # Bonds in the order of np.triu_indices, grouped by colour for drawing, and
+        # the bonds at each spin for updating which are satisfied
+        self.coordList = spinCoords(self.N, self.center, 290)
+        self.bondPairs = np.triu_indices(self.N, 1)
+        self.bondLines = [
+            QLineF(self.coordList[i], self.coordList[j])
+            for i, j in zip(*self.bondPairs)
+        ]
+        colors = [bondColor(self.Jij, i, j) for i, j in zip(*self.bondPairs)]
+        self.bondGroups = {
+            color: np.flatnonzero([c == color for c in colors]) for color in set(colors)
+        }
+        self.spinBonds = [
+            np.flatnonzero((self.bondPairs[0] == i) | (self.bondPairs[1] == i))
+            for i in range(self.N)
+        ]
+        self.layers.clear()
+
+        # The new state starts its local fields from scratch
+        self.spins = None
+        self.setState(self.gs[0] if self.pending_cnfg is None else self.pending_cnfg)
+        if resized:
+            self.editLabels()
+        else:
+            self.updateLabels()
+        self.repaint()
+
+    def setState(self, cnfg):
+        # Moves to basis state cnfg. The energy (-JZZ) follows from the local fields
+        # of the spins that flip, O(N) each, instead of the spectrum
+        self.cnfg = cnfg
+        self.configuration = self.basis.state(self.cnfg).tolist()
+        spins = 2 * np.array(self.configuration, dtype=float) - 1
+        if self.spins is None:
+            self.spins = spins
+            self.fields = self.K @ spins
+            self.energy = -0.5 * spins @ self.fields
+            i, j = self.bondPairs
+            self.unsatisfied = self.Jij[i, j] * spins[i] * spins[j] < 0
+        else:
+            flipped = np.flatnonzero(spins != self.spins)
+            for i in flipped:
+                s = self.spins[i]
+                self.energy += 2 * s * self.fields[i]
+                self.fields -= 2 * s * self.K[:, i]
+                self.spins[i] = -s
+                # Only the bonds of a flipped spin change between satisfied or not
+                self.unsatisfied[self.spinBonds[i]] ^= True
+            if len(flipped) == 0:
+                return
+        # The bond layer is redrawn on the next paint
+        self.layers.pop("bonds", None)
+
     def paintEvent(self, event):
+        if self.spins is None:
+            # Nothing loaded yet
+            return
         qp = QPainter()
         qp.begin(self)
-        qp.scale(self.Swidth / 1000, self.Swidth / 1000)
-        qp.setPen(QPen(Qt.blue, 3))
-        self.drawBonds(qp, self.coordList, self.configuration)
-        self.drawSpins(qp, self.coordList)
-        self.labelSpins(qp, self.coordList)
+        if self.cacheLayers:
+            qp.drawPixmap(0, 0, self.layer("bonds", self.drawBonds))
+            qp.drawPixmap(0, 0, self.layer("spins", self.drawStatic, tuple(self.p)))
+            qp.scale(self.Swidth / 1000, self.Swidth / 1000)
+        else:
+            qp.scale(self.Swidth / 1000, self.Swidth / 1000)
+            self.drawBonds(qp)
+            self.drawStatic(qp)
         self.drawConfiguration(qp, self.configuration, self.coordList)
         qp.end()
 
+    def saveImage(self, path):
+        # The window as it is shown, as PNG or (drawn directly, not from the cached
+        # pixmaps) as SVG
+        if path.lower().endswith(".svg"):
+            generator = QSvgGenerator()
+            generator.setFileName(path)
+            generator.setSize(self.size())
+            generator.setViewBox(self.rect())
+            qp = QPainter()
+            qp.begin(generator)
+            self.cacheLayers = False
+            self.render(qp)
+            self.cacheLayers = True
+            qp.end()
+        elif not self.grab().save(path):
+            raise OSError(f"Could not write {path}")
+
+    def layer(self, name, draw, key=None):
+        # Transparent pixmap the size of the window with draw(qp) in the scaled
+        # coordinates, redrawn only when the size, scale or key change (or the layer
+        # is dropped from self.layers)
+        key = (self.size(), self.Swidth, key)
+        if name not in self.layers or self.layers[name][0] != key:
+            ratio = self.devicePixelRatioF()
+            pixmap = QPixmap(self.size() * ratio)
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.transparent)
+            qp = QPainter()
+            qp.begin(pixmap)
+            qp.scale(self.Swidth / 1000, self.Swidth / 1000)
+            draw(qp)
+            qp.end()
+            self.layers[name] = (key, pixmap)
+        return self.layers[name][1]
+
+    def drawStatic(self, qp):
+        self.drawSpins(qp, self.coordList)
+        self.labelSpins(qp, self.coordList)
+
     def drawSpins(self, qp, coordList):
         qp.setBrush(QBrush(QColor(0, 0, 0), Qt.SolidPattern))
         for i in range(len(coordList) - 1, -1, -1):
@@ -234,27 +469,14 @@ class Window(QMainWindow):
             qp.drawEllipse(c - QPointF(25, 25), 50, 50)
             # qp.drawEllipse(c[0] - 25, c[1] - 25, 50, 50)
 
-    def drawBonds(self, qp, coordList, config):
-        self.ubondCountArray = [0 for i in range(self.N)]
-        self.sbondCountArray = [0 for i in range(self.N)]
-        for i in range(self.N):
-            for j in range(i + 1, self.N):
-                if (
-                    int(self.Jij[i][j] * (2 * config[i] - 1) * (2 * config[j] - 1))
-                    == -1
-                ):
-                    self.ubondCountArray[i] += 1
-                    self.ubondCountArray[j] += 1
-                    qp.setPen(QPen(bondColor(self.Jij, i, j), 5, Qt.DashLine))
-                else:
-                    self.sbondCountArray[i] += 1
-                    self.sbondCountArray[j] += 1
-                    qp.setPen(QPen(bondColor(self.Jij, i, j), 5, Qt.SolidLine))
-                ci = coordList[i]
-                cj = coordList[j]
-                qp.drawLine(ci, cj)
-        self.countLabel.setText("Unsatisfied: " + str(sum(self.ubondCountArray) // 2))
-        self.scountLabel.setText("Satisfied: " + str(sum(self.sbondCountArray) // 2))
+    def drawBonds(self, qp):
+        # One drawLines per pen: bond colour, dashed if unsatisfied
+        for color, bonds in self.bondGroups.items():
+            for unsatisfied, style in ((False, Qt.SolidLine), (True, Qt.DashLine)):
+                group = bonds[self.unsatisfied[bonds] == unsatisfied]
+                if len(group) > 0:
+                    qp.setPen(QPen(color, 5, style))
+                    qp.drawLines([self.bondLines[b] for b in group])
 
     def labelSpins(self, qp, coordList):
         qp.setPen(Qt.black)
@@ -273,29 +495,17 @@ class Window(QMainWindow):
             i += 1
 
     def drawConfiguration(self, qp, config, coordList):
-        i = 0
-        for c in coordList:
-            if config[i] == 1:
-                qp.setPen(QPen(Qt.magenta, 4))
-                self.drawArrow(qp, 1, c)
-            else:
-                qp.setPen(QPen(Qt.cyan, 4))
-                self.drawArrow(qp, -1, c)
-            i += 1
-
-    def drawArrow(self, qp, dir, coords):
-        qp.drawLine(coords + QPointF(0, dir * 15), coords - QPointF(0, dir * 15))
-        qp.drawLine(coords - QPointF(10, dir * 5), coords - QPointF(0, dir * 15))
-        qp.drawLine(coords + QPointF(10, -(dir * 5)), coords - QPointF(0, dir * 15))
-        # qp.drawLine(
-        #     coords[0], coords[1] + (dir * 15), coords[0], coords[1] - (dir * 15)
-        # )
-        # qp.drawLine(
-        #     coords[0] - 10, coords[1] - (dir * 5), coords[0], coords[1] - (dir * 15)
-        # )
-        # qp.drawLine(
-        #     coords[0] + 10, coords[1] - (dir * 5), coords[0], coords[1] - (dir * 15)
-        # )
+        # One drawLines per arrow direction
+        for dir, color in ((1, Qt.magenta), (-1, Qt.cyan)):
+            qp.setPen(QPen(color, 4))
+            qp.drawLines(
+                [
+                    line
+                    for c, up in zip(coordList, config)
+                    if (2 * up - 1) == dir
+                    for line in arrowLines(dir, c)
+                ]
+            )
 
     def editLabels(self):
         fontsize = int((self.Swidth / 1000) * 13)
@@ -305,19 +515,18 @@ class Window(QMainWindow):
             self.Ealabel.setStyleSheet("color: black")
             self.Ealabel.resize(int(0.3 * self.Swidth), int(0.04 * self.Sheight))
             self.Ealabel.move(int(0.02 * self.Swidth), int(0.067 * self.Sheight))
-            self.Ealabel.setText("Ground States: " + str(self.gs))
 
             self.Enlabel.setFont(QFont("Arial", fontsize))
             self.Enlabel.setStyleSheet("color: black")
             self.Enlabel.resize(int(0.2 * self.Swidth), int(0.04 * self.Sheight))
             self.Enlabel.move(int(0.02 * self.Swidth), int(0.107 * self.Sheight))
-            self.Enlabel.setText("Current Energy: " + str(self.ea[self.cnfg]))
 
         self.Clabel.setFont(QFont("Arial", fontsize))
         self.Clabel.setStyleSheet("color: black")
         self.Clabel.resize(int(0.4 * self.Swidth), int(0.04 * self.Sheight))
         self.Clabel.move(int(0.7 * self.Swidth), int(0.023 * self.Sheight))
-        self.Clabel.setText("Current State: " + str(self.configuration))
+
+        self.updateLabels()
 
         self.cEdit.setStyleSheet("color: black")
         self.cEdit.move(int(0.08 * self.Swidth), int(0.933 * self.Sheight))
@@ -331,15 +540,13 @@ class Window(QMainWindow):
 
         self.countLabel.setStyleSheet("color: black")
         self.countLabel.setFont(QFont("Arial", fontsize))
-        self.countLabel.setText("unsatisfied: ")
         self.countLabel.move(int(0.02 * self.Swidth), int(0.267 * self.Sheight))
-        self.countLabel.resize(int(0.1 * self.Swidth), int(0.043 * self.Sheight))
+        self.countLabel.resize(int(0.2 * self.Swidth), int(0.043 * self.Sheight))
 
         self.scountLabel.setStyleSheet("color: black")
         self.scountLabel.setFont(QFont("Arial", fontsize))
-        self.scountLabel.setText("satisfied: ")
         self.scountLabel.move(int(0.02 * self.Swidth), int(0.333 * self.Sheight))
-        self.scountLabel.resize(int(0.1 * self.Swidth), int(0.043 * self.Sheight))
+        self.scountLabel.resize(int(0.2 * self.Swidth), int(0.043 * self.Sheight))
 
         # self.sEdit.setStyleSheet("color: black")
         # self.sEdit.move(0.08*self.Swidth, 0.867*self.Sheight)
@@ -367,13 +574,11 @@ class Window(QMainWindow):
 
         self.NLabel.setStyleSheet("color: black")
         self.NLabel.setFont(QFont("Arial", fontsize))
-        self.NLabel.setText("N: " + str(self.N))
         self.NLabel.move(int(0.02 * self.Swidth), int(0.8 * self.Sheight))
         self.NLabel.resize(int(0.05 * self.Swidth), int(0.043 * self.Sheight))
 
         self.BCLabel.setStyleSheet("color: black")
         self.BCLabel.setFont(QFont("Arial", fontsize))
-        self.BCLabel.setText("Bond Configuration: " + str(self.BC)[::-1])
         self.BCLabel.move(int(0.7 * self.Swidth), int(0.1 * self.Sheight))
         self.BCLabel.resize(int(0.3 * self.Swidth), int(0.043 * self.Sheight))
 
@@ -403,6 +608,125 @@ class Window(QMainWindow):
         self.Resizebutton.resize(int(0.1 * self.Swidth), int(0.043 * self.Sheight))
         self.Resizebutton.move(int(0.12 * self.Swidth), int(0.013 * self.Sheight))
 
+        self.progressBar.resize(int(0.2 * self.Swidth), int(0.043 * self.Sheight))
+        self.progressBar.move(int(0.42 * self.Swidth), int(0.933 * self.Sheight))
+
+        # Beside the progress bar, below the spins
+        if self.browseLabel is not None:
+            self.browseLabel.setStyleSheet("color: black; background: transparent")
+            self.browseLabel.setFont(QFont("Arial", fontsize))
+            self.browseLabel.move(int(0.64 * self.Swidth), int(0.933 * self.Sheight))
+            self.browseLabel.resize(int(0.26 * self.Swidth), int(0.043 * self.Sheight))
+
+    def updateLabels(self):
+        # Texts of the couplings and state, blank until the couplings have loaded
+        loaded = self.spins is not None
+        self.NLabel.setText("N: " + str(self.N))
+        self.BCLabel.setText("Bond Configuration: " + str(self.BC)[::-1])
+        if self.show_Ens:
+            self.Ealabel.setText(
+                ("Ground States: " if not loaded or self.exact else "Lowest Found: ")
+                + (str(self.gs) if loaded else "")
+            )
+            self.Enlabel.setText(
+                "Current Energy: " + (energyText(self.energy) if loaded else "")
+            )
+        self.Clabel.setText(
+            "Current State: " + (str(self.configuration) if loaded else "")
+        )
+        unsatisfied = int(self.unsatisfied.sum()) if loaded else 0
+        satisfied = len(self.unsatisfied) - unsatisfied if loaded else 0
+        self.countLabel.setText("Unsatisfied: " + (str(unsatisfied) if loaded else ""))
+        self.scountLabel.setText("Satisfied: " + (str(satisfied) if loaded else ""))
+
+
+class CouplingsWorker(QThread):
+    """Runs loadCouplings for each (key, N, BC) of jobs off the GUI thread,
+    stopping at the next stage once interruption is requested"""
+
+    progress = pyqtSignal(int)
+    loaded = pyqtSignal(object)
+
+    def __init__(self, jobs, loadBC, seed, show_Ens):
+        QThread.__init__(self)
+        self.jobs = jobs
+        self.args = (loadBC, seed, show_Ens)
+
+    def run(self):
+        for key, N, BC in self.jobs:
+            couplings = loadCouplings(
+                N,
+                BC,
+                *self.args,
+                cancelled=self.isInterruptionRequested,
+                progress=self.progress.emit,
+            )
+            if couplings is None:
+                return
+            couplings["key"] = key
+            self.loaded.emit(couplings)
+
+
+def loadCouplings(
+    N, BC, loadBC, seed, show_Ens, cancelled=lambda: False, progress=lambda p: None
+):
+    """
+    Couplings (parsed from the bond configuration BC with loadBC), spectrum and
+    ground states of a spin glass. Returns None if cancelled() is True between stages
+    """
+    G = tfim.Jij_instance(N, 1, "bimodal", seed, True)
+    if loadBC:
+        Jij = BCtoJij(N, str(BC))
+        G = JijtoG(Jij, N)
+    else:
+        Jij = makeJij(G, N)
+    lattice = tfim.Lattice([N])
+    couplings = {
+        "N": N,
+        "BC": BC,
+        "G": G,
+        "Jij": Jij,
+        "K": tfim.coupling_matrix(G),
+        "lattice": lattice,
+        "basis": tfim.IsingBasis(lattice),
+    }
+    progress(10)
+    if show_Ens and N > SPECTRUM_MAX_N:
+        if cancelled():
+            return None
+        result = SGSolvers.anneal(G, SGSolvers.annealing_schedule(G, 200), seed=seed)
+        couplings["ea"] = None
+        # Python ints, past 63 spins the indices don't fit int64
+        couplings["gs"] = np.array(result["ground_states"], dtype=object)
+        couplings["exact"] = False
+    elif show_Ens:
+        if cancelled():
+            return None
+        couplings["ea"] = tfim.cached_spectrum(couplings["basis"], G)
+        progress(90)
+        if cancelled():
+            return None
+        couplings["gs"] = couplings["ea"].ground_states()
+        couplings["exact"] = True
+    progress(100)
+    return couplings
+
+
+def browse(configurations, N, start=None):
+    """
+    Opens a viewer on the bond configurations of an output_obj of SGFrustration (or
+    a list of them) starting from start, and returns once it's closed. The viewer
+    and what it precomputed are kept for the next call
+    """
+    global _app, _browser
+    _app = QApplication.instance() or QApplication(sys.argv[:1])
+    if _browser is None:
+        first = start or next(iter(configurations))
+        _browser = Window(["-N", str(N), "-loadBC", "-BC", first])
+    _browser.setConfigurations(configurations, N, start)
+    _browser.show()
+    _app.exec()
+
 
 def scaleDims(width, height):
     if height / width > 00.75:
@@ -418,6 +742,21 @@ def scaleDims(width, height):
     return (Swidth, Sheight)
 
 
+def energyText(energy):
+    # Integers for integer couplings, without the float error the local field
+    # updates pick up
+    energy = round(float(energy), 9)
+    return str(int(energy)) if energy.is_integer() else str(energy)
+
+
+def arrowLines(dir, coords):
+    return [
+        QLineF(coords + QPointF(0, dir * 15), coords - QPointF(0, dir * 15)),
+        QLineF(coords - QPointF(10, dir * 5), coords - QPointF(0, dir * 15)),
+        QLineF(coords + QPointF(10, -(dir * 5)), coords - QPointF(0, dir * 15)),
+    ]
+
+
 def spinCoords(N, center, r):
     coords = []
     for i in range(N):
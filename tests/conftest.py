@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the top of the repository, and the tests shouldn't fill the
+# user's circuit and spectrum caches (both read QISKITSG_CACHE on import)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["QISKITSG_CACHE"] = tempfile.mkdtemp(prefix="QiskitSG-tests-")
@@ -0,0 +1,62 @@
+import itertools as it
+
+import pytest
+
+import SGClassical
+import SGFrustration as sgf
+
+
+def brute_force(N: int) -> dict:
+    # Bond configuration of every spin state, bond 0 and spin 0 rightmost, where a
+    # bond is 1 (ferromagnetic) when its spins agree
+    configs = {}
+    for spins in it.product("01", repeat=N):
+        spin_state = "".join(spins)
+        s = spin_state[::-1]
+        bond_state = "".join(
+            "1" if s[i] == s[j] else "0" for i, j in sgf.bond_list_maker(N)
+        )[::-1]
+        configs.setdefault(bond_state, []).append(spin_state)
+    return configs
+
+
+@pytest.mark.parametrize("N", [3, 4, 5, 6])
+def test_unfrustrated_bond_configs(N):
+    exact = SGClassical.unfrustrated_bond_configs(N)
+    configs = brute_force(N)
+    assert list(exact) == sorted(configs)
+    for bond_state, spin_states in configs.items():
+        assert exact[bond_state]["spin_states"] == sorted(spin_states)
+        assert exact[bond_state]["probability"] == 1 / 2 ** (N - 1)
+    # Enumerated a few spin states at a time
+    chunks = list(SGClassical.iter_unfrustrated_bond_configs(N, chunk_size=3))
+    assert sorted(b for bond_states, _, _ in chunks for b in bond_states) == list(exact)
+
+
+def test_verify():
+    exact = SGClassical.unfrustrated_bond_configs(4)
+    assert not any(SGClassical.verify(exact, 4).values())
+
+    output = dict(exact)
+    missing, wrong = list(output)[:2]
+    del output[missing]
+    output[wrong] = {"probability": 0.1, "spin_states": ["0000", "1111"]}
+    output["000000"] = {"probability": 0.1, "spin_states": []}
+    report = SGClassical.verify(output, 4)
+    assert report == {
+        "missing": [missing],
+        "unexpected": ["000000"],
+        "wrong_spin_states": [wrong],
+    }
+
+
+@pytest.mark.parametrize("N", [3, 4, 5])
+def test_grover_search_matches_enumeration(N):
+    output = sgf.batch_run(N)["output"]
+    exact = SGClassical.unfrustrated_bond_configs(N)
+    assert list(output) == list(exact)
+    for bond_state, entry in exact.items():
+        assert output[bond_state]["spin_states"] == entry["spin_states"]
+        assert output[bond_state]["probability"] == pytest.approx(
+            entry["probability"], rel=1 - sgf.MIN_SUCCESS_PROBABILITY
+        )
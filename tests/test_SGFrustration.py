@@ -0,0 +1,171 @@
+import json
+
+import numpy as np
+import pytest
+
+import SGFrustration as sgf
+
+
+@pytest.mark.parametrize("N,loops", [(3, 6), (4, 6), (5, 24)])
+def test_grover_loop_number(N, loops):
+    # The counted optimum reproduces the loop counts that used to be hard coded
+    bond_list = sgf.bond_list_maker(N)
+    assert (
+        sgf.grover_loop_number(len(bond_list), sgf.count_solutions(N, bond_list))
+        == loops
+    )
+
+
+@pytest.mark.parametrize("N", [3, 4, 5])
+def test_counting(N):
+    bond_list = sgf.bond_list_maker(N)
+    # One bond state per spin state solves the oracle
+    assert sgf.count_solutions(N, bond_list) == 1
+    if sgf.counting_qubits_needed(len(bond_list)) > sgf.MAX_COUNTING_QUBITS:
+        with pytest.raises(ValueError):
+            sgf.quantum_count(N, bond_list)
+    elif N == 3:
+        assert sgf.quantum_count(N, bond_list) == 1
+
+
+def assert_same_output(output, expected):
+    assert list(output) == list(expected)
+    for bond_state, entry in expected.items():
+        assert output[bond_state]["spin_states"] == entry["spin_states"]
+        assert output[bond_state]["probability"] == pytest.approx(
+            entry["probability"], abs=1e-9
+        )
+
+
+@pytest.mark.parametrize("N", [3, 4, 5])
+@pytest.mark.parametrize("oracle", sgf.ORACLES)
+@pytest.mark.parametrize("symmetric", [False, True])
+def test_numpy_engine(N, oracle, symmetric):
+    assert_same_output(
+        sgf.batch_run(N, "numpy", oracle, symmetric)["output"],
+        sgf.batch_run(N, "aer", oracle, symmetric)["output"],
+    )
+
+
+@pytest.mark.parametrize("N", [3, 4, 5])
+@pytest.mark.parametrize("engine", sgf.ENGINES)
+def test_phase_oracle(N, engine):
+    assert_same_output(
+        sgf.batch_run(N, engine, "phase")["output"],
+        sgf.batch_run(N, engine, "ancilla")["output"],
+    )
+
+
+def test_oracle_report():
+    # Without its ancilla and XOR ladders the phase oracle is smaller
+    bond_list = sgf.bond_list_maker(4)
+    report = sgf.oracle_report(4, bond_list, 2)
+    assert report["phase"]["qubits"] == report["ancilla"]["qubits"] - 1
+    assert report["phase"]["cx"] < report["ancilla"]["cx"]
+
+
+@pytest.mark.parametrize("N", [3, 4, 5])
+@pytest.mark.parametrize("engine", sgf.ENGINES)
+@pytest.mark.parametrize("oracle", sgf.ORACLES)
+def test_symmetric(N, engine, oracle):
+    # Fixing spin 0 and adding back the flipped partners changes nothing
+    assert_same_output(
+        sgf.batch_run(N, engine, oracle, True)["output"],
+        sgf.batch_run(N, engine, oracle, False)["output"],
+    )
+
+
+@pytest.mark.parametrize("N", [3, 4, 5])
+@pytest.mark.parametrize("engine", sgf.ENGINES)
+@pytest.mark.parametrize("oracle", sgf.ORACLES)
+def test_grover_sweep(N, engine, oracle):
+    bond_list = sgf.bond_list_maker(N)
+    num_of_solutions = sgf.count_solutions(N, bond_list)
+    optimal = sgf.grover_loop_number(len(bond_list), num_of_solutions)
+    sweep = sgf.grover_sweep(N, engine=engine, oracle=oracle)
+    assert [step["iteration"] for step in sweep] == list(range(2 * optimal + 1))
+
+    theta = np.arcsin(np.sqrt(num_of_solutions / 2 ** len(bond_list)))
+    assert sweep[optimal]["success_probability"] == pytest.approx(
+        np.sin((2 * optimal + 1) * theta) ** 2
+    )
+    assert sweep[optimal]["success_probability"] >= sgf.MIN_SUCCESS_PROBABILITY
+
+
+def test_sweep_option(tmp_path, capsys):
+    sgf.main(["-N", "3", "-engine", "numpy", "-sweep", "2"])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "N=3" and len(lines) == 4
+
+    path = str(tmp_path / "sweep.json")
+    sgf.main(["-N", "3", "4", "-engine", "numpy", "-sweep", "-output", path])
+    with open(path) as f:
+        sweeps = json.load(f)
+    assert [result["N"] for result in sweeps] == [3, 4]
+    assert len(sweeps[0]["sweep"]) == 2 * 6 + 1
+
+
+def cached_probabilities(N, cache_dir):
+    backend = sgf.Aer.get_backend("aer_simulator_statevector")
+    bond_list = sgf.bond_list_maker(N)
+    qc = sgf.transpiled_grover_circuit(N, bond_list, 2, backend, cache_dir=cache_dir)
+    return sgf.simulate_aer(qc, len(bond_list), transpiled=True)
+
+
+def test_circuit_cache(tmp_path, monkeypatch):
+    built = cached_probabilities(3, str(tmp_path))
+    (path,) = tmp_path.glob("*.qpy")
+
+    # Loaded, not rebuilt, the second time
+    def no_build(*args):
+        raise AssertionError("built instead of loaded from the cache")
+
+    with monkeypatch.context() as m:
+        m.setattr(sgf, "grover_circuit", no_build)
+        assert np.allclose(cached_probabilities(3, str(tmp_path)), built)
+    assert list(tmp_path.glob("*.qpy")) == [path]
+
+    # A corrupt entry is rebuilt
+    path.write_bytes(b"not a circuit")
+    assert np.allclose(cached_probabilities(3, str(tmp_path)), built)
+    assert path.read_bytes() != b"not a circuit"
+
+
+def without_timing(results):
+    return [{k: v for k, v in result.items() if k != "seconds"} for result in results]
+
+
+def test_batch_workers():
+    results = sgf.batch([3, 4], engine="numpy", verify=True)
+    assert [result["N"] for result in results] == [3, 4]
+    assert all(not any(result["verification"].values()) for result in results)
+    assert without_timing(
+        sgf.batch([3, 4], engine="numpy", verify=True, workers=2)
+    ) == (without_timing(results))
+
+
+def test_main_output(tmp_path):
+    results = sgf.batch([3, 4], engine="numpy")
+    path = str(tmp_path / "results.json")
+    sgf.main(["-N", "3", "4", "-engine", "numpy", "-output", path])
+    with open(path) as f:
+        assert without_timing(json.load(f)) == without_timing(results)
+
+    path = str(tmp_path / "results.npz")
+    sgf.main(["-N", "3", "4", "-engine", "numpy", "-output", path])
+    arrays = np.load(path)
+    for result in results:
+        prefix = f"N{result['N']}_"
+        output = result["output"]
+        assert arrays[prefix + "loop_number"] == result["loop_number"]
+        assert arrays[prefix + "bond_states"].tolist() == list(output)
+        assert np.allclose(
+            arrays[prefix + "probabilities"],
+            [entry["probability"] for entry in output.values()],
+        )
+        # Every spin state points back at the bond state it solves
+        bond_states = arrays[prefix + "bond_states"][arrays[prefix + "spin_bond_index"]]
+        spin_states = arrays[prefix + "spin_states"]
+        for bond_state, spin_state in zip(bond_states, spin_states):
+            assert spin_state in output[bond_state]["spin_states"]
+        assert len(spin_states) == sum(len(e["spin_states"]) for e in output.values())
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import SGSolvers
+import tfim
+
+INSTANCES = [
+    (N, dist, seed)
+    for N in range(3, 11)
+    for dist in ("normal", "bimodal")
+    for seed in range(2)
+]
+
+
+def spectrum(J: np.ndarray) -> tfim.SymmetricSpectrum:
+    return tfim.SymmetricSpectrum(SGSolvers.ising_basis(J.shape[1]), J)
+
+
+@pytest.mark.parametrize("N,dist,seed", INSTANCES)
+def test_branch_and_bound(N, dist, seed):
+    J = tfim.Jij_instance(N, 1, dist, seed, False)
+    exact = spectrum(J)
+    # Down to single spin leaves, and with the tree split between workers
+    for leaf_bits, workers in ((1, 1), (SGSolvers.LEAF_BITS, 1), (2, 2)):
+        result = SGSolvers.branch_and_bound(J, workers=workers, leaf_bits=leaf_bits)
+        assert result["energy"] == pytest.approx(exact.min())
+        assert result["ground_states"] == exact.ground_states().tolist()
+
+
+@pytest.mark.parametrize("dist", ["normal", "bimodal"])
+@pytest.mark.parametrize("method", ["anneal", "tempering"])
+def test_monte_carlo(dist, method):
+    J = tfim.Jij_instance(12, 1, dist, 1, False)
+    exact = SGSolvers.branch_and_bound(J)
+    if method == "anneal":
+        result = SGSolvers.anneal(J, SGSolvers.annealing_schedule(J, 200), seed=0)
+    else:
+        result = SGSolvers.parallel_tempering(J, sweeps=200, seed=0)
+    assert result["energy"] == pytest.approx(exact["energy"])
+    assert set(result["ground_states"]) <= set(exact["ground_states"])
+    # Each replica's best state has the energy reported for it
+    assert np.allclose(spectrum(J)[np.array(result["states"])], result["energies"])
+
+
+def test_monte_carlo_no_sweeps():
+    J = tfim.Jij_instance(10, 1, "normal", 0, False)
+    for result in (
+        SGSolvers.anneal(J, SGSolvers.annealing_schedule(J, 0), seed=0),
+        SGSolvers.parallel_tempering(J, sweeps=0, seed=0),
+    ):
+        assert result["sweeps"] == 0
+        assert np.allclose(spectrum(J)[np.array(result["states"])], result["energies"])
+    with pytest.raises(SystemExit):
+        SGSolvers.main(["-N", "10", "-method", "anneal", "-sweeps", "0"])
@@ -0,0 +1,215 @@
+import numpy as np
+import pytest
+
+import tfim
+
+
+def reference_JZZ_SK_ME(N: int, J: np.ndarray) -> np.ndarray:
+    # The original element by element JZZ_SK_ME, states from binary strings
+    JZZ = np.zeros(2**N)
+    shift_state = np.zeros(N, dtype=int)
+    for b in range(2**N):
+        state = 2 * np.array(list(bin(b)[2:].zfill(N))).astype(int) - 1
+        for shift in range(1, N // 2 + 1):
+            shift_state[shift:] = state[:-shift]
+            shift_state[:shift] = state[-shift:]
+            if (N % 2 == 0) and (shift == N // 2):
+                JZZ[b] += 0.5 * np.dot(J[shift - 1, :] * shift_state, state)
+            else:
+                JZZ[b] += np.dot(J[shift - 1, :] * shift_state, state)
+    return JZZ
+
+
+def reference_Jij_instance(N: int, J: float, dist: str, seed: int, even: bool):
+    # The original Jij_instance, drawing from the seeded global generator
+    np.random.seed(seed)
+    if dist == "bimodal":
+        if even:
+            num_of_bonds = (N * (N - 1)) // 2
+            if N % 4 == 0:
+                a1 = [-1 for i in range(num_of_bonds // 2)]
+            else:
+                a1 = [-1 for i in range((num_of_bonds // 2) + 1)]
+            a2 = [1 for i in range(num_of_bonds // 2)]
+            a = list(np.random.permutation(a1 + a2))
+            Jij = [a[(N * j) : N * (j + 1)] for j in range(N // 2)]
+            if N % 2 == 0:
+                Jij[(N // 2) - 1] += Jij[(N // 2) - 1]
+            return np.array(Jij)
+        Jij = np.random.choice([-1, 1], size=(N // 2, N))
+    else:
+        Jij = np.random.normal(scale=J / np.sqrt(N), size=(N // 2, N))
+    if N % 2 == 0:
+        Jij[-1, N // 2 :] = Jij[-1, : N // 2]
+    return Jij
+
+
+def basis(N: int) -> tfim.IsingBasis:
+    return tfim.IsingBasis(tfim.Lattice([N]))
+
+
+INSTANCES = [
+    (N, dist, seed)
+    for N in range(3, 9)
+    for dist in ("normal", "bimodal")
+    for seed in range(2)
+]
+
+
+@pytest.mark.parametrize("N,dist,seed", INSTANCES)
+def test_JZZ_SK_ME(N, dist, seed):
+    J = tfim.Jij_instance(N, 1, dist, seed, False)
+    reference = reference_JZZ_SK_ME(N, J)
+    # Small chunks, so the states are handled a few at a time
+    assert np.allclose(tfim.JZZ_SK_ME(basis(N), J, chunk_size=4), reference)
+    assert np.allclose(tfim.JZZ_SK(basis(N), J).diagonal(), reference)
+
+
+@pytest.mark.parametrize("N,dist,seed", INSTANCES)
+def test_JZZ_SK_gray(N, dist, seed):
+    J = tfim.Jij_instance(N, 1, dist, seed, False)
+    reference = reference_JZZ_SK_ME(N, J)
+    # Few low bits, so most of the states are reached by Gray code flips
+    assert np.allclose(tfim.JZZ_SK_ME_gray(basis(N), J, low_bits=2), reference)
+
+    energies = -reference
+    E0, ground_states = tfim.SK_ground_states_gray(basis(N), J, low_bits=2)
+    assert E0 == pytest.approx(energies.min())
+    assert np.array_equal(
+        ground_states, np.flatnonzero(np.isclose(energies, energies.min()))
+    )
+
+
+@pytest.mark.parametrize("N,dist,seed", INSTANCES)
+def test_SymmetricSpectrum(N, dist, seed):
+    J = tfim.Jij_instance(N, 1, dist, seed, False)
+    energies = -reference_JZZ_SK_ME(N, J)
+    spectrum = tfim.SymmetricSpectrum(basis(N), J, chunk_size=4)
+    # Only the half with spin 0 down is stored
+    assert len(spectrum.energies) == 2 ** (N - 1) and len(spectrum) == 2**N
+    assert np.allclose(spectrum[np.arange(2**N)], energies)
+    assert spectrum.min() == pytest.approx(energies.min())
+    assert np.array_equal(
+        spectrum.ground_states(),
+        np.flatnonzero(np.isclose(energies, energies.min())),
+    )
+
+
+@pytest.mark.parametrize("N", [3, 6, 7])
+def test_JZZ_SK_batch(N):
+    Js = tfim.Jij_instances(N, 1, "normal", 5, seed=3)
+    spectra = np.array([-reference_JZZ_SK_ME(N, J) for J in Js])
+    # A small memory budget splits the states into several chunks
+    E0, degeneracy, batch = tfim.JZZ_SK_batch(basis(N), Js, spectra=True, memory=2**10)
+    assert np.allclose(batch, spectra)
+    assert np.allclose(E0, spectra.min(axis=1))
+    assert np.array_equal(
+        degeneracy, np.isclose(spectra, spectra.min(axis=1)[:, None]).sum(axis=1)
+    )
+    # The chunks split between processes
+    E0_workers, degeneracy_workers = tfim.JZZ_SK_batch(
+        basis(N), Js, memory=2**10, workers=2
+    )
+    assert np.array_equal(E0_workers, E0)
+    assert np.array_equal(degeneracy_workers, degeneracy)
+
+
+@pytest.mark.parametrize(
+    "N,dist,even",
+    [
+        (N, dist, even)
+        for N in range(3, 10)
+        for dist, even in (("normal", False), ("bimodal", False), ("bimodal", True))
+    ],
+)
+def test_Jij_instance(N, dist, even):
+    for seed in range(3):
+        J = tfim.Jij_instance(N, 1, dist, seed, even)
+        assert np.array_equal(J, reference_Jij_instance(N, 1, dist, seed, even))
+    legacy = tfim.Jij_instances(N, 1, dist, 3, seed=0, even=even, legacy=True)
+    assert np.array_equal(
+        legacy, [tfim.Jij_instance(N, 1, dist, seed, even) for seed in range(3)]
+    )
+
+
+def test_Jij_instances_workers():
+    # The split between workers doesn't change the instances, even with more
+    # workers than instances
+    for count in (0, 2, 7):
+        Js = tfim.Jij_instances(6, 1, "normal", count, seed=1)
+        assert Js.shape == (count, 3, 6)
+        for workers in (2, 4):
+            assert np.array_equal(
+                tfim.Jij_instances(6, 1, "normal", count, seed=1, workers=workers),
+                Js,
+            )
+
+
+def dense_Sx(N: int) -> np.ndarray:
+    # Sum of sigma^x_i: flipping spin i flips bit N-1-i of the index
+    Sx = np.zeros((2**N, 2**N))
+    for index in range(2**N):
+        for i in range(N):
+            Sx[index ^ (1 << (N - 1 - i)), index] += 1
+    return Sx
+
+
+@pytest.mark.parametrize("N", [3, 6])
+def test_Sx_apply(N):
+    v = np.random.default_rng(N).normal(size=2**N)
+    assert np.allclose(tfim.Sx_apply(basis(N), v), dense_Sx(N) @ v)
+    out = np.ones(2**N)
+    assert np.allclose(tfim.Sx_apply(basis(N), v, out), 1 + dense_Sx(N) @ v)
+
+
+@pytest.mark.parametrize("N", [6, 8])
+@pytest.mark.parametrize("h", [0.0, 0.5, 2.0])
+def test_SK_ground_state(N, h):
+    J = tfim.Jij_instance(N, 1, "normal", N, False)
+    H = np.diag(-reference_JZZ_SK_ME(N, J)) - h * dense_Sx(N)
+    v = np.random.default_rng(N).normal(size=2**N)
+    assert np.allclose(tfim.SK_hamiltonian(basis(N), J, h) @ v, H @ v)
+
+    E, V = tfim.SK_ground_state(basis(N), J, h, k=3)
+    assert np.allclose(E, np.linalg.eigvalsh(H)[:3])
+    assert np.allclose(H @ V, V * E)
+
+
+def test_cached_spectrum(tmp_path):
+    J = tfim.Jij_instance(8, 1, "normal", 0, False)
+    energies = tfim.SymmetricSpectrum(basis(8), J).energies
+    # Kept even though it alone is over max_bytes, and then read back
+    for _ in range(2):
+        spectrum = tfim.cached_spectrum(basis(8), J, str(tmp_path), max_bytes=1000)
+        assert np.allclose(spectrum.energies, energies)
+        assert len(list(tmp_path.glob("*.npy"))) == 1
+    # Other spectra are evicted to make room
+    for seed in (1, 2):
+        J = tfim.Jij_instance(8, 1, "normal", seed, False)
+        tfim.cached_spectrum(basis(8), J, str(tmp_path), max_bytes=1000)
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+    # Recomputed if it's gone by the time it's looked up
+    for path in tmp_path.glob("*.npy"):
+        path.unlink()
+    spectrum = tfim.cached_spectrum(basis(8), J, str(tmp_path))
+    assert np.allclose(spectrum.energies, tfim.SymmetricSpectrum(basis(8), J).energies)
+
+
+@pytest.mark.parametrize("N", [3, 8, 63, 64, 65, 100])
+def test_bit_conversions(N):
+    b = basis(N)
+    rng = np.random.default_rng(N)
+    states = rng.integers(0, 2, size=(20, N)).astype(np.uint8)
+    states[0] = 1
+    states[1] = 0
+    indices = b.indices(states)
+    assert indices[0] == 2**N - 1 and indices[1] == 0
+    assert np.array_equal(b.states(indices), states)
+    assert np.array_equal(b.spin_states(indices), 2 * states.astype(int) - 1)
+    assert np.array_equal(b.indices(2 * states.astype(int) - 1), indices)
+    assert np.array_equal(b.unpack(b.pack(states)), states)
+    for state, index in zip(states, indices):
+        # Spin 0 is the most significant bit
+        assert index == int("".join(map(str, state)), 2)
+        assert b.index(state) == index
+        assert np.array_equal(b.state(index), state)
@@ -10,11 +10,24 @@
     --Edited down to bare funcionality for qiskit project by Asher Lantz Oct. 2020
 """
 
+import glob
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 from scipy import sparse
 from scipy.sparse import linalg as spla
 import progressbar
 
+# Spectra cached by cached_spectrum, least recently used ones are deleted once
+# they take up more than SPECTRUM_CACHE_MAX_BYTES
+SPECTRUM_CACHE_DIR = os.path.join(
+    os.environ.get("QISKITSG_CACHE",os.path.join(os.path.expanduser("~"),".cache")),
+    "QiskitSG","spectra")
+SPECTRUM_CACHE_MAX_BYTES = 2**32
+
 ###############################################################################
 class Lattice:
     """Define a lattice"""
@@ -41,15 +54,58 @@ class IsingBasis:
     
     def state(self,index):
         """Returns the state associated with index"""
-        return np.array(list(bin(index)[2:].zfill(self.N))).astype(int)
+        return self.states(np.array([index]))[0].astype(int)
+    
+    def states(self,index):
+        """Returns the states (0/1, as uint8) associated with an array of
+            indices, one per row"""
+        if self.N > 63:
+            # Python ints, to their big endian bytes one at a time
+            size = -(-self.N//8)
+            index = np.ravel(np.asarray(index,dtype=object))
+            data = b''.join(int(i).to_bytes(size,'big') for i in index)
+            index = np.frombuffer(data,dtype=np.uint8).reshape(-1,size)
+            return np.unpackbits(index,axis=1)[:,8*size-self.N:]
+        # The big endian bytes of each index unpack to its bits with the
+        # ith spin, the (N-1-i)th bit, in column 64-N+i
+        index = np.asarray(index,dtype='>u8').reshape(-1,1)
+        return np.unpackbits(index.view(np.uint8),axis=1)[:,64-self.N:]
     
     def spin_state(self,index):
         """Returns the spin state associated with index"""
         return 2*self.state(index) - 1
     
+    def spin_states(self,index):
+        """Returns the spin states (as int8) associated with an array of
+            indices, one per row"""
+        return 2*self.states(index).astype(np.int8) - 1
+    
     def index(self,state):
         """Returns the index associated with state"""
-        return int(''.join(state.astype(str)),2)
+        return int(self.indices(np.asarray(state)[None,:])[0])
+    
+    def indices(self,states):
+        """Returns the indices associated with the rows of states (0/1, or
+            spins where up is the 1), the inverse of states
+            --An object array of Python ints past N = 63"""
+        width = 8*(-(-self.N//8)) if self.N > 63 else 64
+        bits = np.zeros((len(states),width),dtype=np.uint8)
+        bits[:,width-self.N:] = np.asarray(states) > 0
+        packed = np.packbits(bits,axis=1)
+        if self.N > 63:
+            # Too big for int64, Python ints instead
+            return np.array([int.from_bytes(row.tobytes(),'big')
+                             for row in packed],dtype=object)
+        return packed.view('>u8')[:,0].astype(np.int64)
+    
+    def pack(self,states):
+        """Returns the rows of states (0/1) packed 8 spins to a byte, for
+            storing large sets of states"""
+        return np.packbits(np.asarray(states,dtype=np.uint8),axis=1)
+    
+    def unpack(self,packed):
+        """Returns the states stored by pack"""
+        return np.unpackbits(packed,axis=1,count=self.N)
     
     def flip(self,state,i):
         """Flips ith spin in state"""
@@ -57,25 +113,277 @@ class IsingBasis:
     
 
 ###############################################################################
-def JZZ_SK_ME(basis,J):
+def coupling_matrix(J):
+    """Returns the symmetric matrix K of the couplings J (as made by
+        Jij_instance), with zero diagonal, such that
+        --JZZ = \sum_{i<j} K_{ij}\sigma^z_i \sigma^z_j"""
+
+    N = J.shape[1]
+    K = np.zeros((N,N))
+    i = np.arange(N)
+    for shift in range(1,N//2+1):
+        # Row shift-1 of J couples spin i to spin i-shift
+        if (N%2 == 0) and (shift == N//2):
+            # Each pair appears twice at the half way shift
+            Jshift = 0.5*J[shift-1,:]
+        else:
+            Jshift = J[shift-1,:]
+        np.add.at(K,(i,(i-shift)%N),Jshift)
+        np.add.at(K,((i-shift)%N,i),Jshift)
+    return K
+
+###############################################################################
+def JZZ_SK_ME(basis,J,chunk_size=2**16):
     """ Computes matrix elements for the SK interactions
         and returns each as a 1D np.array
-        --JZZ = \sum_{i,j} J_{ij}\sigma^z_i \sigma^z_j"""
+        --JZZ = \sum_{i,j} J_{ij}\sigma^z_i \sigma^z_j
+        --Basis states are handled chunk_size at a time to bound memory"""
     
+    K = coupling_matrix(J)
     JZZ = np.zeros(basis.M)
-    shift_state = np.zeros(basis.N,dtype=int)
-    for b in range(basis.M):
-        state = basis.spin_state(b)
-        for shift in range(1,basis.N//2+1):
-            shift_state[shift:] = state[:-shift]
-            shift_state[:shift] = state[-shift:]
-            if (basis.N%2 == 0) and (shift == basis.N//2):
-                JZZ[b] = JZZ[b] + 0.5*np.dot(J[shift-1,:]*shift_state,state)
-            else:
-                JZZ[b] = JZZ[b] + np.dot(J[shift-1,:]*shift_state,state)
+    for start in range(0,basis.M,chunk_size):
+        stop = min(start+chunk_size,basis.M)
+        JZZ[start:stop] = JZZ_K(basis.spin_states(np.arange(start,stop)),K)
 
     return JZZ
 
+###############################################################################
+def JZZ_K(spins,K):
+    """Returns JZZ for each row of spins given the coupling matrix K"""
+    return 0.5*np.einsum('bi,bi->b',spins @ K,spins)
+
+###############################################################################
+def JZZ_SK_gray(basis,J,low_bits=20):
+    """ Generator over the SK matrix elements in blocks. The last low_bits
+        spins are enumerated as a block of 2**low_bits basis states while
+        the other (high) spins visit their states in Gray code order, so
+        each new block differs from the last by a single high spin flip.
+        Its elements are updated from maintained local fields in one
+        vector addition instead of being recomputed in O(N^2) per state
+        --Yields (start, JZZ) with JZZ the elements of basis states
+            start, ..., start + 2**low_bits - 1"""
+
+    L = min(low_bits,basis.N)
+    H = basis.N - L
+    K = coupling_matrix(J)
+    
+    # Interactions within the low spins, and each high spin's field on
+    # every low spin state
+    low_spins = IsingBasis(Lattice([L])).spin_states(np.arange(2**L))
+    JZZ_low = JZZ_K(low_spins,K[H:,H:])
+    field_low = K[:H,H:] @ low_spins.T
+    
+    # Start with all the high spins down (high index 0)
+    high_spins = -np.ones(H)
+    field_high = K[:H,:H] @ high_spins
+    JZZ_high = 0.5*np.dot(high_spins,field_high)
+    JZZ_cross = high_spins @ field_low
+    high_index = 0
+    yield 0, JZZ_low + JZZ_cross + JZZ_high
+    
+    for step in range(1,2**H):
+        # Gray code: flip the bit of the lowest set bit of step
+        bit = (step & -step).bit_length() - 1
+        i = H - 1 - bit
+        s = high_spins[i]
+        JZZ_high -= 2*s*field_high[i]
+        field_high -= 2*s*K[:H,i]
+        JZZ_cross -= 2*s*field_low[i]
+        high_spins[i] = -s
+        high_index ^= 1 << bit
+        yield high_index << L, JZZ_low + JZZ_cross + JZZ_high
+
+###############################################################################
+def JZZ_SK_ME_gray(basis,J,out=None,low_bits=20):
+    """ JZZ_SK_ME through JZZ_SK_gray, written into out (e.g. a np.memmap
+        for spectra that don't fit in memory) when given"""
+    
+    if out is None:
+        out = np.zeros(basis.M)
+    for start,JZZ in JZZ_SK_gray(basis,J,low_bits):
+        out[start:start+len(JZZ)] = JZZ
+    return out
+
+###############################################################################
+def SK_ground_states_gray(basis,J,low_bits=20,tol=1e-9):
+    """ Streams the SK energies (-JZZ, as in SGViz) through JZZ_SK_gray
+        keeping only the minimum, without storing all 2**N of them
+        --Returns the ground state energy and the indices of all the
+            states within tol of it"""
+    
+    E0 = np.inf
+    ground_states = []
+    for start,JZZ in JZZ_SK_gray(basis,J,low_bits):
+        E = -JZZ
+        Emin = E.min()
+        if Emin < E0 - tol:
+            E0 = Emin
+            ground_states = []
+        if Emin <= E0 + tol:
+            ground_states.append(start + np.flatnonzero(E <= E0 + tol))
+        
+    return E0, np.sort(np.concatenate(ground_states))
+
+###############################################################################
+class SymmetricSpectrum:
+    """SK energies (-JZZ, as in SGViz) stored only for the 2**(N-1) states
+        with spin 0 down. JZZ doesn't change when every spin is flipped, so
+        any other index is looked up through its spin flipped partner
+        --energies can pass in the stored half, e.g. from cached_spectrum"""
+    def __init__(self,basis,J,chunk_size=2**16,energies=None):
+        self.N = basis.N
+        self.M = basis.M
+        self.half = basis.M//2  # Spin 0 is the highest bit of the index
+        
+        if energies is not None:
+            self.energies = energies
+            return
+        K = coupling_matrix(J)
+        self.energies = np.zeros(self.half)
+        for start in range(0,self.half,chunk_size):
+            stop = min(start+chunk_size,self.half)
+            self.energies[start:stop] = -JZZ_K(
+                                basis.spin_states(np.arange(start,stop)),K)
+    
+    def representative(self,index):
+        """Returns the index with spin 0 down equivalent to index"""
+        index = np.asarray(index)
+        return np.where(index < self.half, index, index ^ (self.M - 1))
+    
+    def __getitem__(self,index):
+        return self.energies[self.representative(index)]
+    
+    def __len__(self):
+        return self.M
+    
+    def min(self):
+        return self.energies.min()
+    
+    def ground_states(self):
+        """Returns the indices of every ground state, flipped partners
+            included, in increasing order"""
+        gs = np.flatnonzero(self.energies == self.energies.min())
+        return np.sort(np.concatenate((gs,gs ^ (self.M - 1))))
+
+###############################################################################
+def cached_spectrum(basis,J,cache_dir=SPECTRUM_CACHE_DIR,
+                    max_bytes=SPECTRUM_CACHE_MAX_BYTES):
+    """ SymmetricSpectrum of J with its energies memory mapped from a file in
+        cache_dir named by a hash of (N,J), computed and saved first if
+        it isn't there
+        --Integer energies (bimodal couplings) are stored as int16"""
+    
+    key = hashlib.sha256(np.int64(basis.N).tobytes()
+                         + np.ascontiguousarray(J,dtype=float).tobytes())
+    path = os.path.join(cache_dir,key.hexdigest() + '.npy')
+    
+    try:
+        energies = np.load(path,mmap_mode='r')
+        # Mark as recently used
+        os.utime(path)
+    except FileNotFoundError:
+        # Not cached, or evicted by another process since
+        energies = SymmetricSpectrum(basis,J).energies
+        if (np.all(energies == np.round(energies))
+                and np.abs(energies).max() <= np.iinfo(np.int16).max):
+            energies = energies.astype(np.int16)
+        os.makedirs(cache_dir,exist_ok=True)
+        # Write then rename so other processes never see a partial file
+        fd,tmp = tempfile.mkstemp(dir=cache_dir,suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            np.save(f,energies)
+        os.replace(tmp,path)
+        # Map it before evicting, an open map outlives the file being
+        # deleted by another process; if it's already gone keep the
+        # energies in memory
+        try:
+            energies = np.load(path,mmap_mode='r')
+        except FileNotFoundError:
+            pass
+        evict_spectrum_cache(cache_dir,max_bytes,keep=path)
+    
+    return SymmetricSpectrum(basis,J,energies=energies)
+
+###############################################################################
+def evict_spectrum_cache(cache_dir=SPECTRUM_CACHE_DIR,
+                         max_bytes=SPECTRUM_CACHE_MAX_BYTES,keep=None):
+    """Deletes the least recently used spectra, other than the one at keep,
+        until the cache fits in max_bytes
+        --Files deleted by another process meanwhile are skipped"""
+    
+    sizes = {}
+    for path in glob.glob(os.path.join(cache_dir,'*.npy')):
+        try:
+            sizes[path] = (os.path.getmtime(path),os.path.getsize(path))
+        except FileNotFoundError:
+            pass
+    total = sum(size for _,size in sizes.values())
+    for path in sorted(sizes,key=lambda p: sizes[p][0]):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        total -= sizes[path][1]
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+###############################################################################
+def JZZ_SK_batch(basis,Js,spectra=False,memory=2**28,workers=1,tol=1e-9):
+    """ SK energies (-JZZ, as in SGViz) of many coupling instances at once,
+        e.g. a stack of Jij_instance outputs of shape (n,N//2,N)
+        --Each chunk of basis states is turned into a matrix of spin pair
+            products once and multiplied by the couplings of every instance
+        --Chunks are sized so their working arrays take about memory bytes
+            and are shared between workers processes
+        --Only states with spin 0 down are enumerated, the other half are
+            their spin flipped partners
+        --Returns the ground state energies and degeneracies of each
+            instance and, with spectra=True, the (n,2**N) spectra"""
+    
+    pairs = np.array(np.triu_indices(basis.N,1))
+    couplings = np.array([coupling_matrix(J)[pairs[0],pairs[1]] for J in Js]).T
+    n = couplings.shape[1]
+    half = basis.M//2
+    
+    chunk_size = max(1,int(memory//(8*(pairs.shape[1] + n + basis.N))))
+    chunks = [(start,min(start+chunk_size,half))
+                for start in range(0,half,chunk_size)]
+    args = [(basis.N,pairs,couplings,start,stop,spectra,tol)
+                for start,stop in chunks]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(JZZ_SK_batch_chunk,*zip(*args)))
+    else:
+        results = [JZZ_SK_batch_chunk(*a) for a in args]
+    
+    chunk_min = np.array([r[0] for r in results])
+    chunk_count = np.array([r[1] for r in results])
+    E0 = chunk_min.min(axis=0)
+    # Each state with spin 0 down stands for itself and its flipped partner
+    degeneracy = 2*np.where(chunk_min <= E0 + tol,chunk_count,0).sum(axis=0)
+    if not spectra:
+        return E0, degeneracy
+    
+    E = np.concatenate([r[2] for r in results],axis=1)
+    return E0, degeneracy, np.concatenate((E,E[:,::-1]),axis=1)
+
+###############################################################################
+def JZZ_SK_batch_chunk(N,pairs,couplings,start,stop,spectra,tol):
+    """ Energies of basis states start..stop-1 for every instance in
+        JZZ_SK_batch. Returns the minimum energy and its degeneracy in the
+        chunk for each instance, plus the energies if spectra is True"""
+    
+    spins = IsingBasis(Lattice([N])).spin_states(np.arange(start,stop))
+    products = (spins[:,pairs[0]]*spins[:,pairs[1]]).astype(float)
+    E = -(products @ couplings)
+    Emin = E.min(axis=0)
+    count = (E <= Emin + tol).sum(axis=0)
+    if spectra:
+        return Emin, count, E.T
+    return Emin, count, None
+
 ###############################################################################
 def JZZ_SK(basis,J):
     """Builds matrices for infinite range zz interactions
@@ -85,36 +393,130 @@ def JZZ_SK(basis,J):
     I = np.arange(basis.M)
     return sparse.coo_matrix((JZZ_ME,(I,I)),shape=(basis.M,basis.M))
 
+###############################################################################
+def Sx_apply(basis,v,out=None):
+    """ Applies the transverse field term to the vector v without building
+        a matrix and returns the result (added to out if given)
+        --Sx = \sum_i \sigma^x_i
+        --Flipping the ith spin swaps the halves of the (N-1-i)th bit, a
+            reversed view of v reshaped around that bit"""
+    
+    if out is None:
+        out = np.zeros_like(v)
+    for bit in range(basis.N):
+        shape = (2**(basis.N-1-bit),2,2**bit)
+        out.reshape(shape)[...] += v.reshape(shape)[:,::-1,:]
+    return out
+
+###############################################################################
+def SK_hamiltonian(basis,J,h,diag=None):
+    """ Matrix free transverse field SK Hamiltonian as a LinearOperator
+        --H = -JZZ - h Sx, so that the h=0 energies are those of SGViz
+        --diag can pass in already computed -JZZ matrix elements"""
+    
+    if diag is None:
+        diag = -JZZ_SK_ME(basis,J)
+    
+    def matvec(v):
+        v = np.ravel(v)
+        out = diag*v
+        if h != 0:
+            out -= h*Sx_apply(basis,v)
+        return out
+    
+    return spla.LinearOperator((basis.M,basis.M),matvec=matvec,
+                               rmatvec=matvec,dtype=float)
+
+###############################################################################
+def SK_ground_state(basis,J,h,k=1,diag=None,ncv=None,tol=0):
+    """ Lowest k eigenvalues and eigenvectors of SK_hamiltonian by Lanczos
+        (scipy's eigsh). Memory is about ncv (default max(2k+1,20)) vectors
+        of 2**N floats, so lowering ncv helps to reach larger N"""
+    
+    H = SK_hamiltonian(basis,J,h,diag)
+    E,V = spla.eigsh(H,k=k,which='SA',ncv=ncv,tol=tol)
+    order = np.argsort(E)
+    return E[order], V[:,order]
+
 ###############################################################################
 def Jij_instance(N,J,dist,seed,even):
     """Generates an random instance of couplings"""
+    
+    # A private RandomState gives the same couplings as seeding the global
+    # one did, without touching global state
+    return Jij_draw(np.random.RandomState(seed),N,J,dist,even)
+
+###############################################################################
+def Jij_instances(N,J,dist,count,seed=None,even=False,legacy=False,workers=1):
+    """ Generates count random instances of couplings as one stacked array
+        of shape (count,N//2,N)
+        --Each instance draws from its own stream spawned from seed, so the
+            result doesn't depend on how the work is split between workers
+        --With legacy=True instance k is Jij_instance(N,J,dist,seed+k,even)
+            instead, reproducing instances made one seed at a time"""
+    
+    if legacy:
+        seed = 0 if seed is None else seed
+        streams = [seed + k for k in range(count)]
+    else:
+        streams = np.random.SeedSequence(seed).spawn(count)
+    
+    # More workers than instances would leave some with nothing to draw
+    workers = min(workers,count)
+    if workers > 1:
+        batches = [streams[w::workers] for w in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(Jij_batch,[N]*workers,[J]*workers,
+                                    [dist]*workers,batches,[even]*workers))
+        # Undo the round robin split
+        Jij = np.empty((count,) + results[0].shape[1:],dtype=results[0].dtype)
+        for w in range(workers):
+            Jij[w::workers] = results[w]
+        return Jij
+    return Jij_batch(N,J,dist,streams,even)
 
-    np.random.seed(seed)
+###############################################################################
+def Jij_batch(N,J,dist,streams,even):
+    """Stacked instances of couplings, one for each seed or SeedSequence"""
+    
+    rngs = [np.random.RandomState(s) if isinstance(s,(int,np.integer))
+                else np.random.default_rng(s) for s in streams]
+    if not rngs:
+        return np.empty((0,N//2,N),dtype=float if dist == "normal" else int)
+    return np.array([Jij_draw(rng,N,J,dist,even) for rng in rngs])
 
+###############################################################################
+def Jij_draw(rng,N,J,dist,even):
+    """Draws an instance of couplings from rng, a np.random.Generator or
+        RandomState"""
+    
     if dist == "bimodal":
         if even:
             # Generates Jij matrix with even numbers of ferromagnetic and anti-ferromagnetic bonds
             num_of_bonds = (N*(N-1))//2
             if N%4 == 0:
-                a1 = [-1 for i in range(num_of_bonds//2)]
+                a1 = -np.ones(num_of_bonds//2,dtype=int)
             else:
-                a1 = [-1 for i in range((num_of_bonds//2) + 1)]
-            a2 = [1 for i in range(num_of_bonds//2)]
-            a = list(np.random.permutation(a1+a2))
-            Jij = [a[(N*j):N*(j+1)] for j in range(N//2)]
+                a1 = -np.ones((num_of_bonds//2) + 1,dtype=int)
+            a2 = np.ones(num_of_bonds//2,dtype=int)
+            a = rng.permutation(np.concatenate((a1,a2)))
             if N%2 == 0:
-                Jij[(N//2) - 1] += Jij[(N//2) - 1]
-            Jij = np.array(Jij)
+                # The last row holds the N//2 remaining bonds twice
+                a = np.concatenate((a[:num_of_bonds],
+                                    a[num_of_bonds-N//2:num_of_bonds]))
+            Jij = a[:N*(N//2)].reshape(N//2,N)
             
         else:
-            Jij = np.random.choice([-1,1],size=(N//2,N))
+            Jij = rng.choice([-1,1],size=(N//2,N))
             if N%2 == 0:
                 Jij[-1,N//2:] = Jij[-1,:N//2]
 
     elif dist == "normal":
-        Jij = np.random.normal(scale=J/np.sqrt(N),size=(N//2,N))
+        Jij = rng.normal(scale=J/np.sqrt(N),size=(N//2,N))
         if N%2 == 0:
             Jij[-1,N//2:] = Jij[-1,:N//2]
+    
+    else:
+        raise ValueError("Unknown distribution: " + str(dist))
 
     return Jij
-